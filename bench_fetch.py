@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import random
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from mongo_io import get_db, fetch_frame, CURSOR_BATCH_SIZE
+
+# 比較 luboil_data 兩種讀取方式的時間 / 記憶體:
+#   legacy : list(collection.find(...)) -> pd.DataFrame(list)   (原本 fetch_data_from_mongodb 的做法)
+#   fast   : mongo_io.fetch_frame() 逐批解碼成有型別欄位
+# 用法: python bench_fetch.py [筆數, 預設 1000000]
+# 資料寫在獨立的 bench_luboil_data collection, 不動正式資料
+
+BENCH_COLL = "bench_luboil_data"
+
+PRODUCTS = ["R32", "R46", "R68", "32AWS", "46AWS", "68AWS"]
+PLACES = ["北區", "中區", "南區"]
+
+def seed_bench_data(db, n_docs, batch=50000):
+    """產生與 luboil_data 同格式的假交易資料 (筆數不足時才補)"""
+    coll = db[BENCH_COLL]
+    existing = coll.estimated_document_count()
+    if existing >= n_docs:
+        return
+    coll.delete_many({})
+
+    rng = random.Random(42)
+    start = datetime(2023, 1, 1)
+    sales_people = [f"業務員{i:02d}" for i in range(40)]
+    customers = [(f"C{i:05d}", f"客戶股份有限公司{i:05d}") for i in range(3000)]
+
+    docs = []
+    for i in range(n_docs):
+        card_code, cust_name = rng.choice(customers)
+        quantity = float(rng.randint(1, 400))
+        docs.append({
+            "productName": rng.choice(PRODUCTS),
+            "timestamp": (start + timedelta(days=rng.randint(0, 700))).strftime("%Y-%m-%dT00:00:00Z"),
+            "quantity": quantity,
+            "cardCode": card_code,
+            "processYm": "202401",
+            "salesAmount": quantity * rng.uniform(80, 120),
+            "productNumber": "P0001",
+            "salesPerson": rng.choice(sales_people),
+            "custName": cust_name,
+            "custPlace": rng.choice(PLACES)
+        })
+        if len(docs) >= batch:
+            coll.insert_many(docs, ordered=False)
+            docs = []
+    if docs:
+        coll.insert_many(docs, ordered=False)
+
+def legacy_fetch(db):
+    data_list = list(db[BENCH_COLL].find({}, {
+        "_id": 0, "productName": 1, "timestamp": 1, "quantity": 1, "cardCode": 1,
+        "salesAmount": 1, "productNumber": 1, "salesPerson": 1, "custName": 1, "custPlace": 1
+    }).batch_size(CURSOR_BATCH_SIZE))
+    return pd.DataFrame(data_list)
+
+def fast_fetch(db):
+    return fetch_frame(BENCH_COLL)
+
+def measure(name, fn, db):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    df = fn(db)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    frame_mb = df.memory_usage(deep=True).sum() / 1e6
+    print(f"{name:<8} rows={len(df):>9,}  time={elapsed:7.2f}s  peak={peak / 1e6:9.1f} MB  frame={frame_mb:8.1f} MB")
+    return df
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    db = get_db(os.getenv("MONGODB_URI"))
+
+    print(f"=== [bench_fetch.py] seeding {n_docs:,} docs into {BENCH_COLL} ===")
+    seed_bench_data(db, n_docs)
+
+    measure("legacy", legacy_fetch, db)
+    measure("fast", fast_fetch, db)
+
+if __name__ == "__main__":
+    main()
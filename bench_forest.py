@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+import joblib
+
+from compact_forest import THRESHOLD_MODES, compact_path, export_forest, load_forest, check_parity
+
+# 比較 joblib.load + sklearn predict 與 compact_forest (mmap 扁平陣列) 的:
+#   載入時間 / 檔案大小 / 單筆與批次預測延遲 / 預測結果是否一致
+# 用法: python bench_forest.py [best_rf_R32_model.pkl]
+#   不給模型檔時, 用假資料訓練一個與 grid search 結果同規模的森林 (100 棵, 不限深度)
+
+N_FEATURES = 7  # 同 update_and_retrain_all.FEATURE_COLS
+
+def make_bench_model(n_rows=20000, seed=42):
+    from sklearn.ensemble import RandomForestRegressor
+
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([
+        rng.integers(0, 2, n_rows),            # 促銷期
+        rng.gamma(2.0, 50.0, n_rows),          # avg_quantity_per_salesperson
+        rng.integers(0, 2, (n_rows, 3)),       # custPlace one-hot
+        rng.gamma(2.0, 50.0, n_rows),          # avg_quantity_per_customer
+        rng.gamma(2.0, 50.0, n_rows),          # rolling_avg_quantity_7
+    ]).astype(np.float64)
+    y = X[:, 1] * 0.5 + X[:, 6] * 0.3 + rng.normal(0, 20, n_rows)
+    model = RandomForestRegressor(n_estimators=100, random_state=seed, n_jobs=-1)
+    model.fit(X, y)
+    return model, X
+
+def dir_size_mb(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 1e6
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 1e6
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def main():
+    work_dir = tempfile.mkdtemp(prefix="bench_forest_")
+    if len(sys.argv) > 1:
+        model_file = sys.argv[1]
+        model = joblib.load(model_file)
+        X = np.random.default_rng(0).gamma(2.0, 50.0, (20000, model.n_features_in_))
+    else:
+        print("=== [bench_forest.py] training bench forest ===")
+        model, X = make_bench_model()
+        model_file = os.path.join(work_dir, "best_rf_bench_model.pkl")
+        joblib.dump(model, model_file)
+
+    X_batch = X[:10000]
+    X_single = X[:1]
+
+    load_s, _ = timed(lambda: joblib.load(model_file), repeat=3)
+    batch_s, _ = timed(lambda: model.predict(X_batch))
+    single_s, _ = timed(lambda: model.predict(X_single), repeat=20)
+    print(f"{'joblib':<10} size={dir_size_mb(model_file):8.1f} MB  load={load_s * 1e3:8.1f} ms  "
+          f"predict(1)={single_s * 1e3:7.2f} ms  predict({len(X_batch)})={batch_s * 1e3:8.1f} ms")
+
+    for mode in THRESHOLD_MODES:
+        out_dir = export_forest(model, compact_path(os.path.join(work_dir, f"{mode}.pkl")), mode)
+        load_s, forest = timed(lambda: load_forest(out_dir), repeat=3)
+        batch_s, _ = timed(lambda: forest.predict(X_batch))
+        single_s, _ = timed(lambda: forest.predict(X_single), repeat=20)
+        exact, max_err = check_parity(model, forest, X_batch)
+        print(f"{mode:<10} size={dir_size_mb(out_dir):8.1f} MB  load={load_s * 1e3:8.1f} ms  "
+              f"predict(1)={single_s * 1e3:7.2f} ms  predict({len(X_batch)})={batch_s * 1e3:8.1f} ms  "
+              f"exact={exact} max_abs_err={max_err:.3g}")
+
+    print(f"(artifacts in {work_dir})")
+
+if __name__ == "__main__":
+    main()
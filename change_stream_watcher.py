@@ -0,0 +1,187 @@
+import os
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import PyMongoError
+
+from mongo_io import get_db
+from rollup_updater import apply_docs_to_rollups, rollups_via_change_stream
+from online_features import update_features_from_docs
+
+# change stream 需要 replica set (本機測試可用單節點: mongod --replSet rs0 再 rs.initiate())
+WATCHER_ID = "luboil_data_watcher"
+FLUSH_MAX_DOCS = int(os.getenv("WATCHER_FLUSH_MAX_DOCS", "500"))    # 累積幾筆就寫入彙總表
+FLUSH_INTERVAL = float(os.getenv("WATCHER_FLUSH_INTERVAL", "2"))    # 或最多等幾秒
+DEBOUNCE_SECONDS = float(os.getenv("WATCHER_DEBOUNCE_SECONDS", "60"))  # 商品安靜多久後才重算
+MAX_FAILURES = int(os.getenv("WATCHER_MAX_FAILURES", "5"))  # 同一商品連續重算失敗幾次後放棄
+
+###############################
+#  1) 狀態 (resume token / dirty)
+###############################
+def load_resume_token(db):
+    state = db["watcher_state"].find_one({"_id": WATCHER_ID})
+    return state.get("resumeToken") if state else None
+
+def save_resume_token(db, token):
+    db["watcher_state"].update_one(
+        {"_id": WATCHER_ID},
+        {"$set": {"resumeToken": token, "updatedAt": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+def mark_products_dirty(db, productNames):
+    """
+    標記商品的特徵 / 預測需要重算, lastChange 每次有新資料就往後推 (debounce 用)
+    """
+    now = datetime.now(timezone.utc)
+    for productName in productNames:
+        db["dirty_products"].update_one(
+            {"productName": productName},
+            {"$set": {"featuresDirty": True, "forecastDirty": True, "lastChange": now}},
+            upsert=True
+        )
+
+def pop_settled_products(db, debounce_seconds=DEBOUNCE_SECONDS):
+    """
+    取出已經安靜超過 debounce_seconds 的 dirty 商品
+    (同一批 CSV 匯入期間不會反覆重算, 等匯入結束才算一次)
+    """
+    cutoff = datetime.fromtimestamp(time.time() - debounce_seconds, tz=timezone.utc)
+    docs = list(db["dirty_products"].find(
+        {"lastChange": {"$lte": cutoff}},
+        {"_id": 0, "productName": 1, "lastChange": 1, "failures": 1}
+    ))
+    return docs
+
+def clear_dirty(db, settled):
+    """重算完成後清掉 dirty 標記; 若重算期間又有新資料 (lastChange 改變) 則保留"""
+    for doc in settled:
+        db["dirty_products"].delete_one({"productName": doc["productName"], "lastChange": doc["lastChange"]})
+
+def back_off_product(db, doc, max_failures=MAX_FAILURES):
+    """
+    重算失敗: lastChange 往後推 DEBOUNCE_SECONDS * 2^失敗次數 再重試,
+    連續失敗 max_failures 次就放棄 (清掉 dirty, 等下次有新資料再算)
+    """
+    failures = doc.get("failures", 0) + 1
+    if failures >= max_failures:
+        print(f"[ERROR] Recompute for {doc['productName']} failed {failures} times, give up until new data arrives.")
+        clear_dirty(db, [doc])
+        return
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=DEBOUNCE_SECONDS * 2 ** failures)
+    db["dirty_products"].update_one(
+        {"productName": doc["productName"], "lastChange": doc["lastChange"]},
+        {"$set": {"lastChange": retry_at, "failures": failures}}
+    )
+
+###############################
+#  2) 只重算受影響的商品      #
+###############################
+def recompute_products(mongo_uri, productNames):
+    """
+    對指定商品重訓 RandomForest 並重跑日 / 月預測, 只替換這些商品的結果
+    """
+    # sklearn / Prophet 載入很慢, 到第一次真的要重算時才 import (watcher 啟動不必等)
+    import update_and_retrain_all as retrain
+    import predict_future_quantity as daily_forecast
+    import predict_future_quantityMonthly as monthly_forecast
+
+    productNames = sorted(productNames)
+    print(f"[INFO] Recompute for {productNames}")
+
+    # 1) 重訓 + 特徵重要度
+    df = retrain.fetch_data_from_mongodb(mongo_uri, productNames=productNames)
+    if not df.empty:
+        feature_importances_dict = {}
+        for prod in productNames:
+            model_path = retrain.MODEL_MAP.get(prod)
+            if model_path:
+                retrain.retrain_for_product(df, prod, model_path, feature_importances_dict)
+        if feature_importances_dict:
+            retrain.insert_feature_importances_to_mongo(mongo_uri, feature_importances_dict, only_products=True)
+
+    # 2) 日 / 月預測
+    raw_data = daily_forecast.get_data_from_mongodb(productNames)
+    if raw_data:
+        daily_forecast.insert_future_predictions_to_mongodb(
+            daily_forecast.build_future_predictions(raw_data), productNames
+        )
+        monthly_forecast.insert_future_predictions_to_mongodb(
+            monthly_forecast.build_future_predictions_monthly(raw_data), productNames
+        )
+
+###############################
+#  3) 監聽 luboil_data insert #
+###############################
+def flush(db, buffer, token):
+    """彙總表累加 + 線上特徵 + 標記 dirty + 存 resume token"""
+    if buffer:
+        affected = apply_docs_to_rollups(db, buffer)
+        update_features_from_docs(db, buffer)
+        productNames = set(doc["productName"] for doc in buffer if doc.get("productName"))
+        mark_products_dirty(db, productNames)
+        print(f"[INFO] Flushed {len(buffer)} inserts => rollups {affected}, dirty {sorted(productNames)}")
+    if token is not None:
+        save_resume_token(db, token)
+
+def watch(mongo_uri):
+    db = get_db(mongo_uri)
+    collection = db["luboil_data"]
+
+    pipeline = [{"$match": {"operationType": "insert"}}]
+    resume_token = load_resume_token(db)
+    if resume_token:
+        print("[INFO] Resume change stream from saved token.")
+
+    buffer = []
+    last_token = None
+    last_flush = time.time()
+
+    with collection.watch(pipeline, resume_after=resume_token, max_await_time_ms=1000) as stream:
+        print("[INFO] Watching luboil_data inserts ...")
+        while stream.alive:
+            change = stream.try_next()
+            if change is not None:
+                buffer.append(change["fullDocument"])
+                last_token = stream.resume_token
+
+            if len(buffer) >= FLUSH_MAX_DOCS or (time.time() - last_flush >= FLUSH_INTERVAL and (buffer or last_token)):
+                flush(db, buffer, last_token)
+                buffer, last_token = [], None
+                last_flush = time.time()
+
+            if change is None:
+                # 逐商品重算: 任何錯誤 (資料不足、髒資料、模型檔損毀...) 只影響該商品, 不讓 watcher 停掉
+                for doc in pop_settled_products(db):
+                    try:
+                        recompute_products(mongo_uri, [doc["productName"]])
+                    except Exception as e:
+                        print(f"[WARN] Recompute for {doc['productName']} failed: {e!r}")
+                        traceback.print_exc()
+                        back_off_product(db, doc)
+                    else:
+                        clear_dirty(db, [doc])
+
+def main():
+    MONGODB_URI = os.getenv("MONGODB_URI")
+    if not MONGODB_URI:
+        raise ValueError("No MONGODB_URI in environment variables")
+
+    # 匯入流程預設自己累加彙總表 / 線上特徵; watcher 也累加的話每筆都會算兩次
+    if not rollups_via_change_stream():
+        raise SystemExit(
+            "[ERROR] ROLLUPS_VIA_CHANGE_STREAM is not 1: csv_data_updater already applies rollups / online features. "
+            "Set ROLLUPS_VIA_CHANGE_STREAM=1 for both the watcher and the ingest jobs."
+        )
+
+    print("=== [change_stream_watcher.py] START ===")
+    while True:
+        try:
+            watch(MONGODB_URI)
+        except PyMongoError as e:
+            # 連線中斷等錯誤 => 稍後從 resume token 接續
+            print(f"[WARN] Change stream error: {e}, retry in 5s")
+            time.sleep(5)
+
+if __name__ == "__main__":
+    main()
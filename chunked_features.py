@@ -0,0 +1,187 @@
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from pymongo import ASCENDING
+
+from mongo_io import get_db, CURSOR_BATCH_SIZE
+from luboil_schema import DimensionDictionary, expand_doc, reader_projection
+
+# feature_engineering_for_product 的分塊 (out-of-core) 版本:
+#   第一輪: 逐塊累計 salesPerson / custPlace 的 sum / count 與區間內筆數
+#   第二輪: 逐塊計算特徵, 直接寫入預先配置的 float32 陣列;
+#           rolling_avg_quantity_7 以「前一塊的最後 7 筆」接續
+# 輸入 chunk 必須依日期排序 (同一天維持原順序), 與 in-memory 版本的 stable sort 一致:
+#   in-memory 版本依「日期」stable sort, 同一天維持讀取順序 (= 插入順序 = _id 順序),
+#   所以 MongoDB 來源依 (日期, _id) 排序, 不能用完整 timestamp (同一天內時間不同時 rolling 會不同)
+# 記憶體用量 = 一個 chunk + 輸出陣列 (輸出也可傳入 np.memmap)
+
+ROLLING_WINDOW = 7
+SELECTED_COLS = ['timestamp', 'quantity', 'salesAmount', 'custPlace', 'salesPerson']
+CUST_PLACE_COLS = {'custPlace_南區': '南區', 'custPlace_中區': '中區', 'custPlace_北區': '北區'}
+
+###############################
+#  1) chunk 來源              #
+###############################
+def iter_mongo_chunks(productName, chunk_size=50000, mongo_uri=None):
+    """依 (日期, _id) 排序逐塊讀取單一商品的交易 (精簡格式會還原維度名稱)"""
+    db = get_db(mongo_uri)
+    dims = DimensionDictionary(db)
+    projection = reader_projection(SELECTED_COLS)
+    pipeline = [
+        {"$match": {"productName": productName}},
+        # 舊格式 timestamp 為 ISO 字串, $toDate 後再取 UTC 日期
+        {"$addFields": {"_day": {"$dateTrunc": {"date": {"$toDate": "$timestamp"}, "unit": "day"}}}},
+        {"$sort": {"_day": ASCENDING, "_id": ASCENDING}},
+        {"$project": projection},
+    ]
+    cursor = db["luboil_data"].aggregate(
+        pipeline, allowDiskUse=True, batchSize=min(chunk_size, CURSOR_BATCH_SIZE)
+    )
+
+    buffer = []
+    for doc in cursor:
+        buffer.append(expand_doc(doc, dims))
+        if len(buffer) >= chunk_size:
+            yield pd.DataFrame(buffer)
+            buffer = []
+    if buffer:
+        yield pd.DataFrame(buffer)
+
+def iter_frame_chunks(df, chunk_size=50000):
+    """把已在記憶體的 DataFrame 依日期 stable sort 後切塊 (比對 / 測試用)"""
+    ts = df['timestamp']
+    if not pd.api.types.is_datetime64_any_dtype(ts):
+        ts = pd.to_datetime(ts.astype(str).str.split('T').str[0], format='%Y-%m-%d', errors='coerce')
+    order = np.argsort(ts.dt.normalize().to_numpy(), kind='mergesort')
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[order[start:start + chunk_size]]
+
+###############################
+#  2) 單塊前處理              #
+###############################
+def prepare_chunk(chunk, start_date, end_date):
+    """與 in-memory 版本相同的型別轉換 / 日期篩選 (不排序, 假設輸入已排序)"""
+    data = chunk[SELECTED_COLS].copy()
+    for col in ['custPlace', 'salesPerson']:
+        if isinstance(data[col].dtype, pd.CategoricalDtype):
+            data[col] = data[col].astype(object)
+
+    if pd.api.types.is_datetime64_any_dtype(data['timestamp']):
+        ts = data['timestamp']
+        if ts.dt.tz is not None:
+            ts = ts.dt.tz_convert(None)
+        data['timestamp'] = ts.dt.normalize()
+    else:
+        data['timestamp'] = data['timestamp'].astype(str).str.split('T').str[0]
+        data['timestamp'] = pd.to_datetime(data['timestamp'], format='%Y-%m-%d', errors='coerce')
+
+    data['salesAmount'] = pd.to_numeric(data['salesAmount'], errors='coerce').fillna(0)
+    data['quantity'] = pd.to_numeric(data['quantity'], errors='coerce').fillna(0)
+
+    return data[(data['timestamp'] >= start_date) & (data['timestamp'] <= end_date)]
+
+###############################
+#  3) 兩輪分塊計算            #
+###############################
+def _accumulate_stats(make_chunks, start_date, end_date):
+    person_sum = defaultdict(float)
+    person_cnt = defaultdict(int)
+    place_sum = defaultdict(float)
+    place_cnt = defaultdict(int)
+    n_rows = 0
+    last_ts = None
+
+    for chunk in make_chunks():
+        data = prepare_chunk(chunk, start_date, end_date)
+        if data.empty:
+            continue
+        if last_ts is not None and data['timestamp'].iloc[0] < last_ts:
+            raise ValueError("Chunks must be sorted by timestamp")
+        if not data['timestamp'].is_monotonic_increasing:
+            raise ValueError("Chunks must be sorted by timestamp")
+        last_ts = data['timestamp'].iloc[-1]
+
+        n_rows += len(data)
+        g = data.groupby('salesPerson')['quantity'].agg(['sum', 'count'])
+        for key, row in g.iterrows():
+            person_sum[key] += row['sum']
+            person_cnt[key] += int(row['count'])
+        g = data.groupby('custPlace')['quantity'].agg(['sum', 'count'])
+        for key, row in g.iterrows():
+            place_sum[key] += row['sum']
+            place_cnt[key] += int(row['count'])
+
+    person_mean = {k: person_sum[k] / person_cnt[k] for k in person_cnt}
+    place_mean = {k: place_sum[k] / place_cnt[k] for k in place_cnt}
+    return n_rows, person_mean, place_mean
+
+def build_features_chunked(make_chunks, feature_cols, start_date, end_date, out=None):
+    """
+    make_chunks: 無參數函式, 每次呼叫回傳一個新的 chunk iterator (會跑兩輪)
+    feature_cols: 輸出欄位順序 (同 update_and_retrain_all.FEATURE_COLS)
+    out: 可傳入預先配置的 (n, len(feature_cols)) float32 陣列 / np.memmap
+    回傳 (X float32, y float64)
+    """
+    n_rows, person_mean, place_mean = _accumulate_stats(make_chunks, start_date, end_date)
+
+    X = out if out is not None else np.empty((n_rows, len(feature_cols)), dtype=np.float32)
+    y = np.empty(n_rows, dtype=np.float64)
+    col_idx = {name: i for i, name in enumerate(feature_cols)}
+
+    carry = np.empty(0, dtype=np.float64)  # 前一塊最後 ROLLING_WINDOW 筆 quantity
+    pos = 0
+    for chunk in make_chunks():
+        data = prepare_chunk(chunk, start_date, end_date)
+        n = len(data)
+        if n == 0:
+            continue
+        rows = slice(pos, pos + n)
+        quantity = data['quantity'].to_numpy(dtype=np.float64)
+        y[rows] = quantity
+
+        if '促銷期' in col_idx:
+            ts = data['timestamp']
+            X[rows, col_idx['促銷期']] = ((ts.dt.year == 2024) & (ts.dt.month.isin([3, 4, 5]))).to_numpy()
+        if 'avg_quantity_per_salesperson' in col_idx:
+            X[rows, col_idx['avg_quantity_per_salesperson']] = (
+                data['salesPerson'].map(person_mean).astype(float).fillna(0).to_numpy()
+            )
+        if 'avg_quantity_per_customer' in col_idx:
+            X[rows, col_idx['avg_quantity_per_customer']] = (
+                data['custPlace'].map(place_mean).astype(float).fillna(0).to_numpy()
+            )
+        for col, place in CUST_PLACE_COLS.items():
+            if col in col_idx:
+                X[rows, col_idx[col]] = (data['custPlace'] == place).to_numpy()
+        if 'rolling_avg_quantity_7' in col_idx:
+            # shift(1).rolling(7).mean(): 接上前一塊的尾巴再算, 前 7 筆不足視窗 => 0
+            joined = np.concatenate([carry, quantity])
+            rolling = pd.Series(joined).shift(1).rolling(window=ROLLING_WINDOW).mean().fillna(0).to_numpy()
+            X[rows, col_idx['rolling_avg_quantity_7']] = rolling[len(carry):]
+
+        carry = joined[-ROLLING_WINDOW:] if 'rolling_avg_quantity_7' in col_idx else carry
+        pos += n
+
+    return X, y
+
+###############################
+#  4) 與 in-memory 版本比對   #
+###############################
+def check_parity(df_prod, in_memory_fn, feature_cols, start_date, end_date, chunk_size=1000, make_chunks=None):
+    """
+    以同一份資料分別跑 in-memory 與分塊版本, 比較 float32 特徵與 y 是否完全相同
+    in_memory_fn: update_and_retrain_all.feature_engineering_for_product
+    make_chunks: 分塊來源, 預設為 df_prod 切塊; 比對 MongoDB 來源時傳入
+                 lambda: iter_mongo_chunks(productName, chunk_size), df_prod 則為同一商品 fetch_frame 的結果
+    """
+    make_chunks = make_chunks or (lambda: iter_frame_chunks(df_prod, chunk_size))
+    data = in_memory_fn(df_prod)
+    for col in feature_cols:
+        if col not in data.columns:
+            data[col] = 0
+    expected_X = data[feature_cols].to_numpy(dtype=np.float32)
+    expected_y = data['quantity'].to_numpy(dtype=np.float64)
+
+    X, y = build_features_chunked(make_chunks, feature_cols, start_date, end_date)
+    return np.array_equal(expected_X, X) and np.array_equal(expected_y, y)
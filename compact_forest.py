@@ -0,0 +1,192 @@
+import os
+import sys
+import glob
+import json
+
+import numpy as np
+
+# RandomForestRegressor (best_rf_*.pkl) -> 扁平陣列格式, 不需 sklearn / joblib 就能預測:
+#   best_rf_R32_model.forest/
+#       meta.json        { n_trees, n_features, threshold_mode, max_depth }
+#       roots.npy        每棵樹根節點在扁平陣列中的位置
+#       feature.npy      int32,  葉節點為 -1
+#       threshold.npy    float64 / float32 / uint16|uint32 (quantized)
+#       left.npy right.npy  int32, 全域節點位置, 葉節點為 -1
+#       value.npy        float64, 節點預測值 (只用到葉節點)
+#       bins.npy bin_offsets.npy  (quantized 才有) 每個特徵排序後的切點表
+# 每個陣列是獨立 .npy, 載入時用 mmap, 不需反序列化整個 Python 物件
+#
+# threshold_mode:
+#   "float64"   與 sklearn 完全一致
+#   "float32"   切點轉 float32 並往下取整 (X 在 sklearn 內本來就是 float32,
+#               x <= t 等價於 x <= float32_floor(t)), 結果與 sklearn 完全一致
+#   "quantized" 切點換成「該特徵第幾個切點」的 uint16/uint32 代碼, 預測時先把 X 依切點表分箱;
+#               x <= t_k 等價於 code(x) <= k, 所以結果與 sklearn 完全一致
+
+THRESHOLD_MODES = ("float64", "float32", "quantized")
+META_FILE = "meta.json"
+
+def compact_path(model_file):
+    """best_rf_R32_model.pkl -> best_rf_R32_model.forest"""
+    return os.path.splitext(model_file)[0] + ".forest"
+
+###############################
+#  1) 匯出                    #
+###############################
+def _quantize_thresholds(feature, threshold, n_features):
+    """每個特徵排序後的唯一切點表 + 每個節點切點的代碼"""
+    tables = [np.unique(threshold[feature == f]) for f in range(n_features)]
+    # 切點數都在 65535 以內用 uint16, 否則 uint32 (連續特徵 + 不限深度時常見)
+    largest = max((len(t) for t in tables), default=0)
+    codes = np.zeros(len(threshold), dtype=np.uint16 if largest <= np.iinfo(np.uint16).max else np.uint32)
+    offsets = [0]
+    for f, table in enumerate(tables):
+        mask = feature == f
+        codes[mask] = np.searchsorted(table, threshold[mask])
+        offsets.append(offsets[-1] + len(table))
+    bins = np.concatenate(tables) if tables else np.empty(0)
+    return codes, bins, np.asarray(offsets, dtype=np.int64)
+
+def export_forest(model, out_dir, threshold_mode="float64"):
+    """把已訓練的 RandomForestRegressor 寫成扁平陣列目錄, 回傳 out_dir"""
+    if threshold_mode not in THRESHOLD_MODES:
+        raise ValueError(f"threshold_mode must be one of {THRESHOLD_MODES}")
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for est in model.estimators_:
+        tree = est.tree_
+        is_leaf = tree.children_left == -1
+        roots.append(offset)
+        features.append(np.where(is_leaf, -1, tree.feature).astype(np.int32))
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        lefts.append(np.where(is_leaf, -1, tree.children_left + offset).astype(np.int32))
+        rights.append(np.where(is_leaf, -1, tree.children_right + offset).astype(np.int32))
+        values.append(tree.value[:, 0, 0].astype(np.float64))
+        max_depth = max(max_depth, tree.max_depth)
+        offset += tree.node_count
+
+    feature = np.concatenate(features)
+    threshold = np.concatenate(thresholds)
+    arrays = {
+        "roots": np.asarray(roots, dtype=np.int32),
+        "feature": feature,
+        "left": np.concatenate(lefts),
+        "right": np.concatenate(rights),
+        "value": np.concatenate(values),
+    }
+    if threshold_mode == "float32":
+        t32 = threshold.astype(np.float32)
+        rounded_up = t32.astype(np.float64) > threshold
+        t32[rounded_up] = np.nextafter(t32[rounded_up], np.float32(-np.inf))
+        arrays["threshold"] = t32
+    elif threshold_mode == "quantized":
+        arrays["threshold"], arrays["bins"], arrays["bin_offsets"] = _quantize_thresholds(
+            feature, threshold, model.n_features_in_
+        )
+    else:
+        arrays["threshold"] = threshold
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), arr)
+    meta = {
+        "n_trees": len(roots),
+        "n_features": int(model.n_features_in_),
+        "n_nodes": int(offset),
+        "max_depth": int(max_depth),
+        "threshold_mode": threshold_mode,
+    }
+    with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=4)
+    return out_dir
+
+###############################
+#  2) 載入 / 預測             #
+###############################
+class CompactForest:
+    """扁平陣列森林; 陣列以 mmap 開啟, 只在預測時才實際讀到記憶體"""
+
+    def __init__(self, path, mmap_mode="r"):
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.threshold_mode = self.meta["threshold_mode"]
+        names = ["roots", "feature", "threshold", "left", "right", "value"]
+        if self.threshold_mode == "quantized":
+            names += ["bins", "bin_offsets"]
+        for name in names:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode))
+
+    def _prepare(self, X):
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.meta["n_features"]:
+            raise ValueError(f"X must have shape (n, {self.meta['n_features']})")
+        # sklearn 預測前會把 X 轉成 float32, 這裡照做才會走同一條路徑
+        X = X.astype(np.float32).astype(np.float64)
+        if self.threshold_mode == "float32":
+            return X.astype(np.float32)
+        if self.threshold_mode == "quantized":
+            codes = np.empty(X.shape, dtype=np.int32)
+            for f in range(X.shape[1]):
+                table = self.bins[self.bin_offsets[f]:self.bin_offsets[f + 1]]
+                codes[:, f] = np.searchsorted(table, X[:, f], side="left")
+            return codes
+        return X
+
+    def predict(self, X):
+        Xp = self._prepare(X)
+        n, n_trees = Xp.shape[0], len(self.roots)
+        # 所有 (樣本, 樹) 同時往下走, 每輪前進一層; 到葉節點的就移出 active, 不再計算
+        node = np.tile(np.asarray(self.roots, dtype=np.int64), n)
+        sample = np.repeat(np.arange(n), n_trees)
+        active = np.arange(n * n_trees)
+        while active.size:
+            nd = node[active]
+            feat = self.feature[nd]
+            internal = feat >= 0
+            if not internal.all():
+                active, nd, feat = active[internal], nd[internal], feat[internal]
+            go_left = Xp[sample[active], feat] <= self.threshold[nd]
+            node[active] = np.where(go_left, self.left[nd], self.right[nd])
+
+        # 與 sklearn 相同: 依樹的順序逐棵累加再除以樹數 (浮點加總順序一致, 結果才會完全相同)
+        leaf_values = self.value[node].reshape(n, n_trees)
+        total = np.zeros(n)
+        for t in range(n_trees):
+            total += leaf_values[:, t]
+        return total / n_trees
+
+def load_forest(path, mmap_mode="r"):
+    return CompactForest(path, mmap_mode=mmap_mode)
+
+###############################
+#  3) 與 sklearn 比對         #
+###############################
+def check_parity(model, forest, X):
+    """回傳 (是否完全一致, 最大絕對誤差)"""
+    expected = model.predict(X)
+    actual = forest.predict(X)
+    return bool(np.array_equal(expected, actual)), float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+
+def export_all(pattern="best_rf_*.pkl", threshold_mode="float64"):
+    """把目錄內所有 best_rf_*.pkl 轉成 .forest, 回傳轉換的檔案清單"""
+    import joblib
+
+    exported = []
+    for model_file in sorted(glob.glob(pattern)):
+        out_dir = export_forest(joblib.load(model_file), compact_path(model_file), threshold_mode)
+        print(f"[INFO] {model_file} => {out_dir} ({threshold_mode})")
+        exported.append(out_dir)
+    return exported
+
+def main():
+    # 用法: python compact_forest.py [float64|float32|quantized]
+    threshold_mode = sys.argv[1] if len(sys.argv) > 1 else "float64"
+    print("=== [compact_forest.py] START ===")
+    exported = export_all(threshold_mode=threshold_mode)
+    print(f"Exported {len(exported)} forests")
+    print("=== [compact_forest.py] END ===")
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,18 @@
 import os
 import glob
 import csv
-import uuid
 from datetime import datetime
-from pymongo import MongoClient
+from mongo_io import get_db
+from rollup_updater import apply_docs_to_rollups, rollups_via_change_stream
+from online_features import update_features_from_docs
+from luboil_schema import DimensionDictionary, to_compact_doc, parse_timestamp, record_inserts
 
-MONGODB_URI = os.getenv("MONGODB_URI")
-if not MONGODB_URI:
-    raise ValueError("No MONGODB_URI in environment variables")
+# 連線與 pandas 相關模組 (data_quality / parallel_ingest) 都延到 main() 真的有 CSV 要處理時才建立 / import
 
-client = MongoClient(MONGODB_URI)
-db = client["luboil_data_db"]
+# 平行匯入: 多 process 解析 / 驗證, 單一 writer 分批寫入 (見 parallel_ingest.py)
+PARALLEL_INGEST = os.getenv("PARALLEL_INGEST", "0") == "1"
 
-def parse_date_str(date_str):
-    """
-    將 date_str 轉成 offset-aware datetime (UTC).
-    """
-    date_str = date_str.strip()
-    if date_str.endswith("Z"):
-        date_str = date_str[:-1] + "+00:00"
-    else:
-        if "T" in date_str:
-            if "+" not in date_str and "-" not in date_str[10:]:
-                date_str += "+00:00"
-        else:
-            date_str += "T00:00:00+00:00"
-    return datetime.fromisoformat(date_str)  # offset-aware
-
-def get_max_ts_for_product(productName):
+def get_max_ts_for_product(db, productName):
     """
     從資料庫抓該 productName 的最大 timestamp, 若無則回傳 1900-01-01
     (此函式只查一次，不會動態隨插入更新)
@@ -38,11 +23,22 @@ def get_max_ts_for_product(productName):
         projection={"timestamp": 1}
     )
     if latest_rec:
-        db_ts_str = latest_rec["timestamp"].replace("Z", "+00:00")
-        return datetime.fromisoformat(db_ts_str)  # offset-aware
+        # 新格式為 BSON date, 舊格式為 ISO 字串
+        return parse_timestamp(latest_rec["timestamp"])  # offset-aware
     else:
         return datetime.fromisoformat("1900-01-01T00:00:00+00:00")
 
+def update_derived(db, inserted_docs, dims):
+    """新插入的資料累加到彙總表 + 線上特徵 (watcher 在跑時由 watcher 負責)"""
+    # ROLLUPS_VIA_CHANGE_STREAM=1 時由 change_stream_watcher 更新, 這裡不重複累加 (見 rollup_updater)
+    if rollups_via_change_stream():
+        return
+    affected = apply_docs_to_rollups(db, inserted_docs, dims)
+    print(f"Rollups updated: {affected}")
+    # 線上特徵: 只處理這次新插入的交易 (見 online_features.py)
+    feature_counts = update_features_from_docs(db, inserted_docs, dims)
+    print(f"Online features updated: {feature_counts}")
+
 def main():
     print("=== [csv_data_updater.py] START ===")
 
@@ -51,8 +47,27 @@ def main():
         print("No CSV found in updatedData folder, skip insertion.")
         return
 
+    MONGODB_URI = os.getenv("MONGODB_URI")
+    if not MONGODB_URI:
+        raise ValueError("No MONGODB_URI in environment variables")
+    db = get_db(MONGODB_URI)
+
+    from data_quality import frame_from_records, check_frame, quarantine_docs, write_quarantine
+
     inserted_count = 0
     skip_count = 0
+    dims = DimensionDictionary(db)
+    csv_files.sort()  # 依檔名 (ERP 匯出月份) 順序處理
+
+    if PARALLEL_INGEST:
+        from parallel_ingest import run as run_parallel_ingest
+
+        inserted_count, skip_count, quarantined = run_parallel_ingest(
+            db, csv_files, dims, on_file_done=lambda csv_file, docs: update_derived(db, docs, dims)
+        )
+        print(f"\nAll CSV processed. Total inserted: {inserted_count}, skipped={skip_count}, quarantined={quarantined}")
+        print("=== [csv_data_updater.py] END ===")
+        return
 
     # 先將 CSV 全部讀起來(若CSV很多行, 請斟酌用其他方法).
     # 或做單一檔案一次處理, 也行。
@@ -62,7 +77,20 @@ def main():
         # 第一階段：讀CSV所有行到 memory
         with open(csv_file, "r", encoding="utf-8") as f:
             rows = list(csv.DictReader(f))
-        
+
+        # 資料品質檢查 (整批向量化): 不合格的列整批移到 luboil_quarantine, 不寫入 luboil_data
+        # timestamp 直接用 check_frame 解析好的 (UTC), 與平行模式接受的格式一致
+        timestamps = []
+        if rows:
+            raw = frame_from_records(rows)
+            typed, flags = check_frame(raw)
+            quarantined = write_quarantine(db, quarantine_docs(raw, flags, source=csv_file))
+            if quarantined:
+                print(f"Quarantined: {quarantined}")
+            good = flags == 0
+            rows = [row for row, ok in zip(rows, good) if ok]
+            timestamps = [ts.to_pydatetime() for ts in typed["timestamp"][good]]
+
         # 取得所有在此CSV出現的 productName (避免對每行都 findOne)
         productNames_in_csv = set(row["productName"] for row in rows if row.get("productName"))
 
@@ -70,21 +98,12 @@ def main():
         dictProductMaxTs = {}
         for pName in productNames_in_csv:
             if pName:  # 排除空
-                dictProductMaxTs[pName] = get_max_ts_for_product(pName)
+                dictProductMaxTs[pName] = get_max_ts_for_product(db, pName)
 
         # 第二階段：逐行處理
-        for row in rows:
-            productName = row.get("productName")
-            timestamp_str = row.get("timestamp")
-            if not productName or not timestamp_str:
-                skip_count += 1
-                continue
-
-            try:
-                csv_ts = parse_date_str(timestamp_str)
-            except ValueError:
-                skip_count += 1
-                continue
+        inserted_docs = []
+        for row, csv_ts in zip(rows, timestamps):
+            productName = row["productName"]
 
             # 如果 dictionary 沒有, 表示 CSV 有 productName 但沒在 DB => 用(1900-01-01)
             db_max_ts = dictProductMaxTs.get(productName)
@@ -97,37 +116,19 @@ def main():
                 skip_count += 1
                 continue
 
-            # 動態 UUID => 允許同一CSV中 (同 timestamp) 也插多筆
-            row_uuid = str(uuid.uuid4())
-
-            cardCode = row.get("cardCode")
-            processYm = row.get("processYm")
-            quantity = row.get("quantity")
-            salesAmount = row.get("salesAmount")
-            productNumber = row.get("productNumber")
-            salesPerson = row.get("salesPerson")
-            custName = row.get("custName")
-            custPlace = row.get("custPlace")
-
-            doc = {
-                "_importUUID": row_uuid,
-                "productName": productName,
-                "timestamp": csv_ts.isoformat().replace("+00:00","Z"),
-                "quantity": float(quantity) if quantity else 0.0,
-                "cardCode": cardCode,
-                "processYm": processYm,
-                "salesAmount": float(salesAmount) if salesAmount else 0.0,
-                "productNumber": productNumber,
-                "salesPerson": salesPerson,
-                "custName": custName,
-                "custPlace": custPlace
-            }
-
-            # 上傳(單純插入, 不 upsert => 每次執行都新插, 看需求)
-            # 若您想避免同CSV重複 => 用 upsert
-            # 這邊示範 insert_one 就好
-            db.luboil_data.insert_one(doc)
-            inserted_count += 1
+            # 精簡格式: BSON date / 數值 / 維度代碼 (見 luboil_schema.py)
+            row["timestamp"] = csv_ts
+            inserted_docs.append(to_compact_doc(row, dims))
+
+        # 整個檔案一次 insert_many (單純插入, 不 upsert => 每次執行都新插, 看需求)
+        if inserted_docs:
+            db.luboil_data.insert_many(inserted_docs, ordered=False)
+            record_inserts(db, inserted_docs)
+            inserted_count += len(inserted_docs)
+
+        # 第三階段：把這個檔案新插入的資料累加到彙總表 (dashboard 用)
+        if inserted_docs:
+            update_derived(db, inserted_docs, dims)
 
         print(f"Done {csv_file}, inserted so far: {inserted_count}, skipped={skip_count}")
 
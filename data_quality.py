@@ -0,0 +1,173 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from luboil_schema import DIMENSION_FIELDS
+
+# 匯入前的向量化資料品質檢查: 整批 (一個 CSV 檔) 一次算完, 不逐行判斷.
+# 逐列的檢查 (check_rows) 可以分段做; PRICE_OUTLIER / DUPLICATE 依整批計算 (check_batch),
+# 平行匯入時由 writer 在整個檔案到齊後才做, 結果與逐檔模式相同.
+# 不合格的列不寫入 luboil_data, 原始內容 + 原因代碼整批寫入 luboil_quarantine,
+# 之後可人工修正再重新匯入. 一列可能有多個原因.
+#
+# 原因代碼:
+#   MISSING_PRODUCT        productName 空白
+#   BAD_TIMESTAMP          timestamp 空白或無法解析
+#   BAD_QUANTITY           quantity 不是數字
+#   NON_POSITIVE_QUANTITY  quantity <= 0 (退貨 / 沖銷另行處理)
+#   QUANTITY_OUT_OF_RANGE  quantity > DQ_MAX_QUANTITY
+#   BAD_SALES_AMOUNT       salesAmount 不是數字或為負數
+#   PRICE_OUTLIER          單價 salesAmount / quantity 偏離同商品本批中位數 DQ_PRICE_RATIO 倍以上
+#   UNKNOWN_CUST_PLACE     custPlace 不在 KNOWN_CUST_PLACES
+#   DUPLICATE              與本批較早的一列完全相同 (保留第一筆); 預設不檢查, DQ_QUARANTINE_DUPLICATES=1 才啟用.
+#                          同一天兩張內容相同的訂單在這份資料中是正常的 (原本的匯入流程也刻意允許重複)
+#   EXTRA_FIELDS           CSV 該列欄位數比表頭多 (多出的值放在 _extraFields)
+
+QUARANTINE_COLL = "luboil_quarantine"
+KNOWN_CUST_PLACES = ["北區", "中區", "南區"]
+MAX_QUANTITY = float(os.getenv("DQ_MAX_QUANTITY", "100000"))
+PRICE_RATIO = float(os.getenv("DQ_PRICE_RATIO", "5"))
+QUARANTINE_DUPLICATES = os.getenv("DQ_QUARANTINE_DUPLICATES", "0") == "1"
+PRICE_MIN_ROWS = 10  # 同商品本批至少幾筆才判斷單價離群
+
+REASON_CODES = [
+    "MISSING_PRODUCT", "BAD_TIMESTAMP", "BAD_QUANTITY", "NON_POSITIVE_QUANTITY",
+    "QUANTITY_OUT_OF_RANGE", "BAD_SALES_AMOUNT", "PRICE_OUTLIER", "UNKNOWN_CUST_PLACE", "DUPLICATE",
+    "EXTRA_FIELDS",
+]
+REASON_BITS = {code: 1 << i for i, code in enumerate(REASON_CODES)}
+
+RAW_COLS = ["productName", "timestamp", "quantity", "salesAmount", "processYm",
+            "cardCode", "productNumber"] + DIMENSION_FIELDS
+STRING_COLS = ["productName", "cardCode", "productNumber"] + DIMENSION_FIELDS
+EXTRA_COL = "_extraFields"
+DUPLICATE_KEY = ["productName", "timestamp", "quantity", "salesAmount", "cardCode", "productNumber"] + DIMENSION_FIELDS
+
+def _join_extra(value):
+    if isinstance(value, (list, tuple)):
+        return ",".join("" if v is None else str(v) for v in value)
+    return "" if value is None or value != value else str(value)
+
+def frame_from_records(records):
+    """
+    dict 清單 (CSV DictReader / JSON) -> 全部欄位為字串的 DataFrame, 缺值為空字串
+    欄位名稱不是字串的 (DictReader 把多出的欄位放在 None key) 合併成 _extraFields,
+    不能留著當欄位名稱 (寫入 quarantine 時 BSON 只接受字串 key)
+    """
+    raw = pd.DataFrame.from_records(records)
+    extra_cols = [col for col in raw.columns if not isinstance(col, str)]
+    extra = pd.Series("", index=raw.index)
+    if extra_cols:
+        extra = raw[extra_cols].apply(lambda row: ",".join(v for v in map(_join_extra, row) if v), axis=1)
+        raw = raw.drop(columns=extra_cols)
+    for col in RAW_COLS:
+        if col not in raw.columns:
+            raw[col] = ""
+    raw = raw.astype(object).where(raw.notna(), "").astype(str)
+    raw[EXTRA_COL] = extra
+    return raw
+
+###############################
+#  1) 檢查                    #
+###############################
+def check_rows(raw):
+    """
+    raw: 字串 DataFrame (欄位至少含 RAW_COLS)
+    只做逐列的檢查, 回傳 (typed DataFrame, flags) ; flags 為每列的原因 bitmask, 0 = 合格
+    typed: productName... 字串 (空白 -> None), timestamp UTC datetime64,
+           quantity / salesAmount float, processYm Int64
+    """
+    for col in RAW_COLS:
+        if col not in raw.columns:
+            raw[col] = ""
+
+    ts = pd.to_datetime(raw["timestamp"].str.strip(), format="ISO8601", utc=True, errors="coerce")
+    quantity = pd.to_numeric(raw["quantity"], errors="coerce")
+    sales_amount = pd.to_numeric(raw["salesAmount"], errors="coerce")
+
+    typed = pd.DataFrame({col: raw[col].where(raw[col] != "", None) for col in STRING_COLS})
+    typed["timestamp"] = ts
+    typed["quantity"] = quantity
+    typed["salesAmount"] = sales_amount
+    typed["processYm"] = pd.to_numeric(
+        raw["processYm"].str.replace(r"[-/]", "", regex=True).str.strip(), errors="coerce"
+    ).astype("Int64")
+
+    checks = {
+        "MISSING_PRODUCT": typed["productName"].isna(),
+        "BAD_TIMESTAMP": ts.isna(),
+        "BAD_QUANTITY": quantity.isna(),
+        "NON_POSITIVE_QUANTITY": quantity <= 0,
+        "QUANTITY_OUT_OF_RANGE": quantity > MAX_QUANTITY,
+        "BAD_SALES_AMOUNT": sales_amount.isna() | (sales_amount < 0),
+        "UNKNOWN_CUST_PLACE": ~raw["custPlace"].isin(KNOWN_CUST_PLACES),
+        "EXTRA_FIELDS": raw[EXTRA_COL] != "" if EXTRA_COL in raw.columns else pd.Series(False, index=raw.index),
+    }
+    return typed, _flags(checks, len(raw))
+
+def check_batch(raw, typed):
+    """
+    依整批計算的檢查 (PRICE_OUTLIER / DUPLICATE), 回傳 flags.
+    raw / typed 必須是整個檔案 (分段計算時中位數與重複判斷會隨分段方式改變)
+    """
+    quantity = typed["quantity"]
+    sales_amount = typed["salesAmount"]
+
+    # 單價離群: 以同商品本批單價中位數為基準, log 比值超過 log(PRICE_RATIO)
+    valid_price = (quantity > 0) & (sales_amount > 0)
+    unit_price = (sales_amount / quantity).where(valid_price)
+    group = typed["productName"].fillna("")
+    median_price = unit_price.groupby(group).transform("median")
+    group_size = unit_price.groupby(group).transform("count")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_ratio = np.abs(np.log(unit_price / median_price))
+    price_outlier = valid_price & (group_size >= PRICE_MIN_ROWS) & (log_ratio > np.log(PRICE_RATIO))
+
+    checks = {"PRICE_OUTLIER": price_outlier}
+    if QUARANTINE_DUPLICATES:
+        checks["DUPLICATE"] = raw.duplicated(subset=DUPLICATE_KEY, keep="first")
+    return _flags(checks, len(raw))
+
+def check_frame(raw):
+    """check_rows + check_batch; 回傳 (typed DataFrame, flags)"""
+    typed, flags = check_rows(raw)
+    return typed, flags | check_batch(raw, typed)
+
+def _flags(checks, n_rows):
+    flags = np.zeros(n_rows, dtype=np.int64)
+    for code, mask in checks.items():
+        flags |= np.where(mask.to_numpy(), REASON_BITS[code], 0)
+    return flags
+
+def reasons_for(flag):
+    return [code for code in REASON_CODES if flag & REASON_BITS[code]]
+
+###############################
+#  2) quarantine              #
+###############################
+def quarantine_docs(raw, flags, source=None):
+    bad = np.flatnonzero(flags)
+    if len(bad) == 0:
+        return []
+    now = datetime.utcnow()
+    records = [
+        {key: value for key, value in record.items() if key != EXTRA_COL or value}
+        for record in raw.iloc[bad].to_dict(orient="records")
+    ]
+    return [
+        {"record": record, "reasons": reasons_for(int(flag)), "source": source, "quarantinedAt": now}
+        for record, flag in zip(records, flags[bad])
+    ]
+
+def write_quarantine(db, docs):
+    """整批寫入 luboil_quarantine; 回傳 { 原因代碼: 筆數 }"""
+    if not docs:
+        return {}
+    db[QUARANTINE_COLL].insert_many(docs, ordered=False)
+    counts = {}
+    for doc in docs:
+        for code in doc["reasons"]:
+            counts[code] = counts.get(code, 0) + 1
+    return counts
@@ -1,25 +1,30 @@
 import os
 import logging
-from pymongo import MongoClient
+from mongo_io import get_db, close_clients
+from luboil_schema import reset_data_meta
 
-# 設置日誌
-logging.basicConfig(filename="delete_data.log", level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+def main():
+    # 設置日誌
+    logging.basicConfig(filename="delete_data.log", level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 
-# 讀取 MongoDB URI
-mongodb_uri = os.getenv("MONGODB_URI")
-client = MongoClient(mongodb_uri)
+    # 讀取 MongoDB URI
+    mongodb_uri = os.getenv("MONGODB_URI")
 
-try:
-    db = client["luboil_data_db"]
-    collection = db["luboil_data"]
-    logging.info("Connected to Database")
+    try:
+        db = get_db(mongodb_uri)
+        collection = db["luboil_data"]
+        logging.info("Connected to Database")
 
-    # 刪除所有資料
-    result = collection.delete_many({})
-    logging.info(f"Deleted {result.deleted_count} documents from 'luboil_data'")
-    print(f"Deleted {result.deleted_count} documents from 'luboil_data'")
+        # 刪除所有資料
+        result = collection.delete_many({})
+        reset_data_meta(db)
+        logging.info(f"Deleted {result.deleted_count} documents from 'luboil_data'")
+        print(f"Deleted {result.deleted_count} documents from 'luboil_data'")
 
-except Exception as e:
-    logging.critical("Failed to delete data: %s", e)
-finally:
-    client.close()
+    except Exception as e:
+        logging.critical("Failed to delete data: %s", e)
+    finally:
+        close_clients()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Prophet 預測結果的內容定址快取:
+#   key = sha256( 彙總後的 (ds, y) 序列 + periods + freq + 模型設定 )
+#   序列沒變 (例如某商品今天沒有新交易) => 直接回傳上次的預測, 不重新 fit
+# 儲存位置 (FORECAST_CACHE):
+#   disk  (預設) forecast_cache/<key>.json, 以檔案 mtime 當 LRU 時間
+#   mongo        forecast_cache collection, { _id: key, records, lastUsed }
+#   off          不快取
+# 超過 FORECAST_CACHE_MAX_ENTRIES 筆時, 淘汰最久沒用到的
+
+CACHE_BACKEND = os.getenv("FORECAST_CACHE", "disk")
+CACHE_DIR = os.getenv("FORECAST_CACHE_DIR", "forecast_cache")
+CACHE_COLL = "forecast_cache"
+MAX_ENTRIES = int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", "256"))
+
+def series_key(grouped, periods, freq, config):
+    """grouped: 含 ds, y 欄位的 DataFrame"""
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(grouped["ds"].to_numpy(dtype="datetime64[ns]").view("int64")).tobytes())
+    h.update(np.ascontiguousarray(grouped["y"].to_numpy(dtype=np.float64)).tobytes())
+    h.update(json.dumps({"periods": periods, "freq": freq, "config": config}, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+def _dump_records(records):
+    return [dict(row, ds=pd.Timestamp(row["ds"]).isoformat()) for row in records]
+
+def _load_records(records):
+    return [dict(row, ds=pd.Timestamp(row["ds"])) for row in records]
+
+###############################
+#  1) 儲存後端                #
+###############################
+def _mtime_or_zero(path):
+    # ASYNC_IO 時其他 thread 可能同時淘汰同一個檔案; 已不存在的排最前面, 刪除時再略過
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0.0
+
+class DiskStore:
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        try:
+            os.utime(path)  # 更新 LRU 時間
+        except FileNotFoundError:
+            pass  # 讀完之後剛好被其他 thread / process 淘汰, 這次的結果仍可用
+        return records
+
+    def put(self, key, records):
+        # 暫存檔名含 pid / thread id, 同一個 key 同時寫入也不會互相覆蓋暫存檔
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(records, f)
+        os.replace(tmp_path, self._path(key))
+
+    def evict(self, max_entries):
+        entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".json")]
+        if len(entries) <= max_entries:
+            return 0
+        entries.sort(key=_mtime_or_zero)
+        evicted = 0
+        for path in entries[:len(entries) - max_entries]:
+            try:
+                os.remove(path)
+                evicted += 1
+            except FileNotFoundError:
+                pass
+        return evicted
+
+class MongoStore:
+
+    def __init__(self, db=None):
+        from mongo_io import get_db
+
+        self.coll = (db if db is not None else get_db())[CACHE_COLL]
+        self.coll.create_index("lastUsed")
+
+    def get(self, key):
+        doc = self.coll.find_one_and_update({"_id": key}, {"$set": {"lastUsed": datetime.utcnow()}})
+        return doc["records"] if doc else None
+
+    def put(self, key, records):
+        self.coll.replace_one({"_id": key}, {"_id": key, "records": records, "lastUsed": datetime.utcnow()}, upsert=True)
+
+    def evict(self, max_entries):
+        excess = self.coll.estimated_document_count() - max_entries
+        if excess <= 0:
+            return 0
+        oldest = [doc["_id"] for doc in self.coll.find({}, {"_id": 1}).sort("lastUsed", 1).limit(excess)]
+        return self.coll.delete_many({"_id": {"$in": oldest}}).deleted_count
+
+###############################
+#  2) 快取 + 命中統計         #
+###############################
+class ForecastCache:
+
+    def __init__(self, store=None, max_entries=MAX_ENTRIES):
+        self.store = store
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()  # async 版本在 thread pool 內呼叫
+
+    def get_or_compute(self, grouped, periods, freq, config, compute):
+        """
+        compute: 無參數函式, 未命中時呼叫, 回傳預測 records (ds 為 Timestamp)
+        回傳 records 的新 list (呼叫端可自由修改)
+        """
+        if self.store is None:
+            return compute()
+
+        key = series_key(grouped, periods, freq, config)
+        records = self.store.get(key)
+        if records is not None:
+            with self._lock:
+                self.hits += 1
+            return _load_records(records)
+
+        records = compute()
+        self.store.put(key, _dump_records(records))
+        evicted = self.store.evict(self.max_entries)
+        with self._lock:
+            self.misses += 1
+            self.evictions += evicted
+        return [dict(row) for row in records]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_forecast_cache():
+    """依 FORECAST_CACHE 建立 (同一個 process 共用一個)"""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            return _cache
+        if CACHE_BACKEND == "mongo":
+            store = MongoStore()
+        elif CACHE_BACKEND == "off":
+            store = None
+        else:
+            store = DiskStore()
+        _cache = ForecastCache(store)
+        return _cache
@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from "react";
 import FilterControls from "../components/FilterControls";
 import ChartDisplay from "../components/ChartDisplay";
-import { fetchLuboilData, fetchFuturePredictions } from "../services/api";
+import { fetchDailyRollup, fetchFuturePredictions } from "../services/api";
 import PropTypes from "prop-types";
 import { buildColorMap } from "../components/utils/colors";
 
@@ -21,8 +21,8 @@ const ChartContainer = ({ includeFutureData = false, seriesType = "ALL" }) => {
   const [selectedProduct, setSelectedProduct] = useState(["All"]);
 
   useEffect(() => {
-    // 抓取歷史數據
-    fetchLuboilData()
+    // 抓取歷史數據 (預先彙總的日資料)
+    fetchDailyRollup()
       .then((allData) => {
         // 若 seriesType = "R", 只保留 R32, R46, R68
         // 若 seriesType = "AWS", 只保留 32AWS, 46AWS, 68AWS
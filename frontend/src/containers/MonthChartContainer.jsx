@@ -3,7 +3,7 @@ import React, { useEffect, useState } from "react";
 import FilterControls from "../components/FilterControls";
 import ChartDisplayMonth from "../components/ChartDisplayMonth";
 import {
-  fetchLuboilData,
+  fetchMonthlyRollup,
   fetchFutureMonthlyPredictions,
 } from "../services/api";
 import PropTypes from "prop-types";
@@ -19,8 +19,8 @@ const MonthChartContainer = ({ includeFutureData = false }) => {
   const [selectedProduct, setSelectedProduct] = useState(["All"]);
 
   useEffect(() => {
-    // 自己抓月資料 (或者抓同一 daily data? 依您設計)
-    fetchLuboilData()
+    // 抓預先彙總的月資料 (luboil_monthly_rollup)
+    fetchMonthlyRollup()
       .then(setData)
       .catch((err) => console.error("Fetch data error:", err));
 
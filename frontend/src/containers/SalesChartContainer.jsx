@@ -2,7 +2,7 @@
 import React, { useEffect, useState } from "react";
 import FilterControls from "../components/FilterControls";
 import ChartDisplaySales from "../components/ChartDisplaySales";
-import { fetchLuboilData, fetchFuturePredictions } from "../services/api";
+import { fetchDailyRollup, fetchFuturePredictions } from "../services/api";
 import PropTypes from "prop-types";
 import { buildColorMap } from "../components/utils/colors";
 
@@ -16,8 +16,8 @@ const SalesChartContainer = ({ includeFutureData = false }) => {
   const [selectedProduct, setSelectedProduct] = useState(["All"]);
 
   useEffect(() => {
-    // 抓取歷史數據
-    fetchLuboilData()
+    // 抓取歷史數據 (預先彙總的日資料)
+    fetchDailyRollup()
       .then(setData)
       .catch((err) => console.error("Fetch data error:", err));
 
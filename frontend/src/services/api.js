@@ -94,4 +94,35 @@ export const fetchFeatures = async () => {
             throw new Error(`Error in making request: ${error.message}`);
         }
     }
-}
\ No newline at end of file
+}
+
+// 預先彙總的日 / 月資料 (取代抓整個 luboil_data 再在瀏覽器加總)
+// 若未設定專屬環境變數, 以 VITE_API_URL (/api/luboil_data) 推得路徑
+const rollupUrl = (grain) => {
+    const envUrl = grain === "daily"
+        ? import.meta.env.VITE_API_URL_DAILY_ROLLUP
+        : import.meta.env.VITE_API_URL_MONTHLY_ROLLUP;
+    return envUrl || import.meta.env.VITE_API_URL.replace(/\/api\/luboil_data\/?$/, `/api/luboil_rollup/${grain}`);
+}
+
+const fetchRollup = async (grain) => {
+    try {
+        const response = await axios.get(rollupUrl(grain));
+        return response.data; // Axios 的返回數據在 data 屬性中
+    } catch (error) {
+        if (error.response) {
+            // 服務器返回了非 2xx 狀態碼
+            throw new Error(`HTTP error! Status: ${error.response.status}`);
+        } else if (error.request) {
+            // 請求已發送但未收到回應
+            throw new Error("No response received from server.");
+        } else {
+            // 發生其他錯誤
+            throw new Error(`Error in making request: ${error.message}`);
+        }
+    }
+}
+
+export const fetchDailyRollup = () => fetchRollup("daily");
+
+export const fetchMonthlyRollup = () => fetchRollup("monthly");
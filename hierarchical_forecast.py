@@ -0,0 +1,246 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from pymongo import ASCENDING
+
+from mongo_io import get_db, find_docs
+from luboil_schema import DimensionDictionary, expand_doc, reader_projection
+
+# 階層維度: productName 之下再依 區域 / 業務員 拆分
+HIERARCHY_LEVELS = ["custPlace", "salesPerson"]
+
+###############################
+#  1) 從 MongoDB 讀取資料     #
+###############################
+def get_data_from_mongodb():
+    """
+    從MongoDB獲取「潤滑油資料」，除了 productName / timestamp / quantity
+    還需要 custPlace / salesPerson 以建立階層序列
+    """
+    docs = find_docs("luboil_data", {}, reader_projection(
+        ["productName", "timestamp", "quantity", "custPlace", "salesPerson"]
+    ))
+    # 精簡格式的維度代碼還原成名稱
+    dims = DimensionDictionary(get_db())
+    return [expand_doc(doc, dims) for doc in docs]
+
+###############################
+#  2) 建立階層序列            #
+###############################
+def build_bottom_series(df, level, freq="D"):
+    """
+    將單一 productName 的交易資料依 level (custPlace / salesPerson) 攤成寬表:
+      index = 日期 (只包含該商品有交易的日期, 與 predict_quantity 的加總方式一致)
+      columns = level 的各成員, 沒交易的日子補 0
+    如此各成員的加總即等於商品總量, 歷史資料本身就是 coherent 的
+    """
+    df = df.copy()
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="mixed", errors="coerce", utc=True)
+    if df["timestamp"].isnull().any():
+        raise ValueError("Some timestamps could not be parsed. Please check your data.")
+    df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce").fillna(0)
+    df[level] = df[level].fillna("未知").astype(str)
+
+    if df["timestamp"].dt.tz is not None:
+        df["timestamp"] = df["timestamp"].dt.tz_convert(None)
+
+    if freq == "MS":
+        df["ds"] = df["timestamp"].dt.to_period("M").dt.to_timestamp()
+    else:
+        df["ds"] = df["timestamp"].dt.normalize()
+
+    wide = df.pivot_table(index="ds", columns=level, values="quantity", aggfunc="sum", fill_value=0)
+    wide.sort_index(inplace=True)
+    return wide
+
+def summing_matrix(n_bottom):
+    """
+    兩層階層的 summing matrix S:
+      第 0 列 = 商品總量 (全部成員相加)
+      其餘   = 單位矩陣 (各成員本身)
+    """
+    return np.vstack([np.ones((1, n_bottom)), np.eye(n_bottom)])
+
+###############################
+#  3) 基礎預測 (Prophet)      #
+###############################
+def fit_base_forecast(ds, y, periods, freq, interval_width=0.8):
+    """
+    對單一序列跑 Prophet, 回傳:
+      future_df : 未來 periods 筆 (ds, yhat, yhat_lower, yhat_upper)
+      residual_var : 樣本內殘差變異數 (給 MinT 當權重)
+    """
+    from prophet import Prophet  # 載入很慢, 真的要訓練時才 import
+
+    grouped = pd.DataFrame({"ds": ds, "y": y})
+    model = Prophet(interval_width=interval_width)
+    model.fit(grouped)
+
+    future = model.make_future_dataframe(periods=periods, freq=freq)
+    forecast = model.predict(future)
+
+    in_sample = forecast.iloc[:-periods]["yhat"].to_numpy()
+    residual_var = float(np.var(grouped["y"].to_numpy() - in_sample))
+
+    future_df = forecast.iloc[-periods:][["ds", "yhat", "yhat_lower", "yhat_upper"]].reset_index(drop=True)
+    return future_df, residual_var
+
+###############################
+#  4) 調和 (reconciliation)   #
+###############################
+def reconcile(base, S, method="mint", residual_vars=None):
+    """
+    一次對所有預測期做調和 (矩陣運算, 不逐期迴圈)
+      base : shape (n_all, periods) 的基礎預測, 列順序與 S 相同
+      S    : summing matrix, shape (n_all, n_bottom)
+      method:
+        "bottom_up" -> 直接以成員預測相加得到總量
+        "mint"      -> MinT (對角 W, 即 WLS), W = 各序列樣本內殘差變異數
+    回傳 shape (n_all, periods) 的 coherent 預測
+    """
+    n_all, n_bottom = S.shape
+    if method == "bottom_up":
+        return S @ base[n_all - n_bottom:]
+
+    if method != "mint":
+        raise ValueError(f"Unknown reconciliation method: {method}")
+
+    if residual_vars is None:
+        w = np.ones(n_all)
+    else:
+        w = np.asarray(residual_vars, dtype=float)
+        # 變異數為 0 (例如全 0 序列) 時避免除以 0
+        w = np.where(w > 0, w, np.nanmax(w[w > 0]) if (w > 0).any() else 1.0)
+
+    W_inv = np.diag(1.0 / w)
+    # G = (S' W^-1 S)^-1 S' W^-1
+    G = np.linalg.solve(S.T @ W_inv @ S, S.T @ W_inv)
+    return S @ (G @ base)
+
+def forecast_hierarchy_for_product(df_prod, level, periods=10, freq="D", method="mint", total_fit=None):
+    """
+    對單一商品的某個 level 產生 coherent 預測.
+    total_fit: 可傳入已算好的商品總量基礎預測 (future_df, residual_var),
+               多個 level 共用同一個總量模型, 不必重複訓練
+    回傳 (records, total_fit), records 為 list of dict:
+      {level, member, ds, yhat, yhat_lower, yhat_upper}
+    上下界依調和後與基礎預測的差值平移
+    """
+    wide = build_bottom_series(df_prod, level, freq=freq)
+    if len(wide) < 2:
+        raise ValueError("No valid data after grouping - possibly empty dataset")
+
+    members = list(wide.columns)
+    S = summing_matrix(len(members))
+
+    # 總量序列 = 各成員相加 (與 predict_quantity 相同的日加總)
+    series = [("total", "total", wide.sum(axis=1))] + [(level, m, wide[m]) for m in members]
+
+    if total_fit is None:
+        total_fit = fit_base_forecast(wide.index, series[0][2].to_numpy(), periods, freq)
+
+    base_frames = [total_fit[0]]
+    residual_vars = [total_fit[1]]
+    for _, _, y in series[1:]:
+        future_df, res_var = fit_base_forecast(wide.index, y.to_numpy(), periods, freq)
+        base_frames.append(future_df)
+        residual_vars.append(res_var)
+
+    base = np.vstack([f["yhat"].to_numpy() for f in base_frames])
+    lower = np.vstack([f["yhat_lower"].to_numpy() for f in base_frames])
+    upper = np.vstack([f["yhat_upper"].to_numpy() for f in base_frames])
+
+    reconciled = reconcile(base, S, method=method, residual_vars=residual_vars)
+    shift = reconciled - base
+
+    ds = base_frames[0]["ds"]
+    records = []
+    for i, (lvl, member, _) in enumerate(series):
+        for j in range(periods):
+            records.append({
+                "level": lvl,
+                "member": member,
+                "ds": ds.iloc[j],
+                "yhat": float(reconciled[i, j]),
+                "yhat_lower": float(lower[i, j] + shift[i, j]),
+                "yhat_upper": float(upper[i, j] + shift[i, j])
+            })
+    return records, total_fit
+
+###############################
+#  5) 寫回 MongoDB            #
+###############################
+def insert_hierarchy_predictions_to_mongodb(predictions, coll_name="future_quantity_hierarchy"):
+    """
+    將階層預測寫入 MongoDB 並建立索引, 讓 dashboard 依
+    productName / hierarchy / level / member 直接 drill down, 不必即時訓練模型
+    """
+    for prediction in predictions:
+        prediction["timestamp"] = prediction.pop("ds")
+        prediction["quantity"] = prediction.pop("yhat")
+        prediction["lower_bound"] = prediction.pop("yhat_lower")
+        prediction["upper_bound"] = prediction.pop("yhat_upper")
+
+    collection = get_db()[coll_name]
+
+    collection.create_index([
+        ("productName", ASCENDING),
+        ("freq", ASCENDING),
+        ("hierarchy", ASCENDING),
+        ("level", ASCENDING),
+        ("member", ASCENDING),
+        ("timestamp", ASCENDING)
+    ])
+
+    # 刪除舊數據
+    collection.delete_many({})
+    print("Old hierarchy forecast data deleted")
+
+    if predictions:
+        collection.insert_many(predictions)
+    print(f"Inserted {len(predictions)} hierarchy forecast docs into {coll_name}.")
+
+def main():
+    method = os.getenv("HIERARCHY_RECONCILE", "mint")
+    raw_data = get_data_from_mongodb()
+    if not raw_data:
+        print("[WARN] No data from DB, end.")
+        return
+
+    df = pd.DataFrame(raw_data)
+    for level in HIERARCHY_LEVELS:
+        if level not in df.columns:
+            df[level] = None
+
+    all_predictions = []
+    for freq, periods in [("D", 10), ("MS", 5)]:
+        for product, df_prod in df.groupby("productName"):
+            total_fit = None
+            for level in HIERARCHY_LEVELS:
+                try:
+                    records, total_fit = forecast_hierarchy_for_product(
+                        df_prod, level, periods=periods, freq=freq, method=method, total_fit=total_fit
+                    )
+                except ValueError as e:
+                    print(f"[WARN] {product}/{level}/{freq} skip: {e}")
+                    continue
+
+                # 每個 hierarchy 各自 coherent (總量列 level="total")
+                for row in records:
+                    row["productName"] = product
+                    row["hierarchy"] = level
+                    row["freq"] = freq
+                    row["method"] = method
+                    row["ds"] = row["ds"].isoformat() + "Z"
+                    all_predictions.append(row)
+                print(f"[INFO] {product} x {level} ({freq}) reconciled by {method}")
+
+    with open("future_quantity_hierarchy.json", "w", encoding="utf-8") as f:
+        json.dump(all_predictions, f, indent=4, ensure_ascii=False)
+    print("Hierarchy predictions saved to future_quantity_hierarchy.json.")
+
+    insert_hierarchy_predictions_to_mongodb(all_predictions)
+
+if __name__ == "__main__":
+    main()
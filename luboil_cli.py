@@ -0,0 +1,148 @@
+import os
+import re
+import sys
+import subprocess
+
+# 所有 Python job 的共用入口: python luboil_cli.py <子命令> [參數...]
+# 只在執行某個子命令時才 import 該模組 (pandas / sklearn / Prophet 不會因為 --help 或短 job 被載入),
+# MongoDB 連線也都在各模組的 main() 內才建立.
+#
+# python luboil_cli.py importtime [--budget-x N] [子命令...]
+#   以 python -X importtime 在乾淨的 process import 各子命令模組, 檢查 import 時載入的重型套件
+#   (pandas / sklearn / Prophet 等) 是否都在該子命令允許的範圍內, 不在範圍內或 import 失敗時 exit code 1,
+#   可放進 CI 防止冷啟動退化 (tests/test_import_budget.py). 結果與機器快慢無關, 不會因 CI 忙碌而誤判.
+#   import 時間另以「python -c pass 啟動時的 import 時間」的倍數回報;
+#   指定 --budget-x (或 IMPORT_BUDGET_X) 時超過該倍數也算失敗
+
+# import 時間的大宗, 只有真的需要的子命令才可以在 import 時載入
+HEAVY_MODULES = ("numpy", "pandas", "scipy", "sklearn", "joblib", "prophet")
+
+# 子命令 => (模組, 函式, 說明, import 時允許載入的重型套件)
+COMMANDS = {
+    "ingest":          ("csv_data_updater", "main", "匯入 updatedData/*.csv", ()),
+    "import-json":     ("update_mongodbnew", "main", "匯入整批 JSON 歷史資料", ()),
+    "delete-all":      ("delete_all_data", "main", "清空 luboil_data", ()),
+    "migrate":         ("migrate_luboil_schema", "main", "舊格式 doc 轉為精簡格式", ()),
+    "rollups":         ("rollup_updater", "main", "重建 dashboard 彙總表", ()),
+    "watch":           ("change_stream_watcher", "main", "監聽 luboil_data 並增量更新", ()),
+    "online-features": ("online_features", "main", "重建線上特徵", ()),
+    "intervals":       ("prediction_intervals", "main", "從已存抽樣重算預測區間", ("numpy",)),
+    "snapshot":        ("snapshot_cache", "main", "更新本機 Parquet 快照", ("numpy", "pandas")),
+    "export-forest":   ("compact_forest", "main", "RandomForest 轉扁平陣列", ("numpy",)),
+    "retrain":         ("update_and_retrain_all", "main", "重訓 RandomForest", ("numpy", "pandas")),
+    "forecast":        ("predict_future_quantity", "main", "日預測", ("numpy", "pandas")),
+    "forecast-monthly": ("predict_future_quantityMonthly", "main", "月預測", ("numpy", "pandas")),
+    "hierarchy":       ("hierarchical_forecast", "main", "階層預測 (bottom-up / MinT)", ("numpy", "pandas")),
+}
+CLI_ALLOWED = ()  # luboil_cli 本身
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def usage():
+    print("usage: python luboil_cli.py <command> [args...]\n")
+    for name, (module, _, help_text, _) in COMMANDS.items():
+        print(f"  {name:<18} {help_text}  ({module}.py)")
+    print(f"  {'importtime':<18} 檢查各子命令的 import 時間是否在預算內")
+
+def run_command(name, args):
+    import importlib
+
+    module_name, func_name = COMMANDS[name][:2]
+    # 各模組的 main() 自行讀 sys.argv, 這裡換成「直接執行該檔案」時的樣子
+    sys.argv = [module_name + ".py"] + list(args)
+    module = importlib.import_module(module_name)
+    return getattr(module, func_name)()
+
+###############################
+#  import 時間預算            #
+###############################
+def measure_import(module_name=None):
+    """
+    在新的 process 以 -X importtime import module_name (None = 只啟動 python),
+    回傳 (各頂層 import 的累計時間總和 ms, import 後 sys.modules 內的頂層套件名稱 set)
+    """
+    code = "import sys; print(' '.join(sys.modules))"
+    if module_name:
+        code = f"import {module_name}; " + code
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module_name} failed:\n{result.stderr.strip().splitlines()[-1]}")
+    total_us = 0
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and match.group(3) == " ":
+            total_us += int(match.group(2))
+    # importtime 也會列出 import 失敗的選用套件 (pandas 探測 pyarrow 等), 以 sys.modules 為準
+    packages = {name.split(".")[0] for name in result.stdout.split()}
+    return total_us / 1000, packages
+
+def check_import_budget(args):
+    budget_x = None
+    names = []
+    i = 0
+    while i < len(args):
+        if args[i] == "--budget-x":
+            budget_x = float(args[i + 1])
+            i += 2
+        else:
+            names.append(args[i])
+            i += 1
+    if budget_x is None and os.getenv("IMPORT_BUDGET_X"):
+        budget_x = float(os.getenv("IMPORT_BUDGET_X"))
+
+    targets = [("luboil_cli", CLI_ALLOWED)]
+    for name in names or COMMANDS:
+        if name not in COMMANDS:
+            raise SystemExit(f"Unknown command: {name}")
+        module_name, _, _, allowed = COMMANDS[name]
+        targets.append((module_name, allowed))
+
+    baseline_ms, baseline_packages = measure_import()
+    print(f"{'(python -c pass)':<32} {baseline_ms:9.1f} ms")
+
+    failed = []
+    for module_name, allowed in targets:
+        try:
+            elapsed, packages = measure_import(module_name)
+        except RuntimeError as e:
+            print(f"{module_name:<32} ERROR  {e}")
+            failed.append(module_name)
+            continue
+        # 比 python 啟動本身多出來的部分
+        elapsed -= baseline_ms
+        ratio = elapsed / baseline_ms if baseline_ms > 0 else 0.0
+        heavy = sorted((packages - baseline_packages).intersection(HEAVY_MODULES).difference(allowed))
+        status = "OK"
+        if heavy:
+            status = f"HEAVY {','.join(heavy)}"
+        elif budget_x is not None and ratio > budget_x:
+            status = f"OVER {budget_x:g}x"
+        if status != "OK":
+            failed.append(module_name)
+        print(f"{module_name:<32} {elapsed:9.1f} ms  {ratio:6.1f}x  {status}")
+
+    if failed:
+        print(f"\n[FAIL] import budget exceeded: {failed}")
+        return 1
+    print("\n[OK] all imports within budget")
+    return 0
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        usage()
+        return 0
+    name, args = sys.argv[1], sys.argv[2:]
+    if name == "importtime":
+        return check_import_budget(args)
+    if name not in COMMANDS:
+        usage()
+        return 2
+    run_command(name, args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
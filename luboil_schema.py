@@ -0,0 +1,186 @@
+from datetime import datetime, timezone
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# luboil_data 的精簡儲存格式 (schemaVersion = 2):
+#   timestamp   -> BSON date (原本是 ISO 字串)
+#   processYm   -> int, ex: 202401 (原本是字串)
+#   quantity / salesAmount -> double
+#   custName / custPlace / salesPerson -> 存成 int 代碼 (custNameId / custPlaceId / salesPersonId),
+#       代碼與原字串的對照表放在 luboil_dimensions
+#   _importUUID -> 不再儲存
+# productName / cardCode / productNumber 保留字串 (查詢條件與 API 直接使用)
+
+SCHEMA_VERSION = 2
+DIMENSIONS_COLL = "luboil_dimensions"
+META_COLL = "luboil_meta"
+DATA_META_ID = "luboil_data"
+DIMENSION_FIELDS = ["custName", "custPlace", "salesPerson"]
+
+def code_field(dim):
+    return dim + "Id"
+
+###############################
+#  1) 維度字典                #
+###############################
+class DimensionDictionary:
+    """
+    custName / custPlace / salesPerson 的 字串 <-> int 代碼 對照.
+    對照表存在 luboil_dimensions: { dim, value, code }, 代碼由 counter doc 遞增配發;
+    同一個 process 內會快取, 不會每筆都查 DB
+    """
+
+    def __init__(self, db):
+        self.coll = db[DIMENSIONS_COLL]
+        self.codes = {dim: {} for dim in DIMENSION_FIELDS}
+        self.values = {dim: {} for dim in DIMENSION_FIELDS}
+        self.reload()
+
+    def ensure_indexes(self):
+        self.coll.create_index([("dim", ASCENDING), ("value", ASCENDING)], unique=True, sparse=True)
+        self.coll.create_index([("dim", ASCENDING), ("code", ASCENDING)], unique=True, sparse=True)
+
+    def reload(self):
+        for doc in self.coll.find({"dim": {"$in": DIMENSION_FIELDS}}, {"_id": 0, "dim": 1, "value": 1, "code": 1}):
+            self.codes[doc["dim"]][doc["value"]] = doc["code"]
+            self.values[doc["dim"]][doc["code"]] = doc["value"]
+
+    def encode(self, dim, value):
+        """字串 -> 代碼, 新值會配發新代碼並寫入對照表; 空值回傳 None"""
+        if value is None or value == "":
+            return None
+        code = self.codes[dim].get(value)
+        if code is not None:
+            return code
+
+        counter = self.coll.find_one_and_update(
+            {"_id": f"counter:{dim}"},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        code = counter["seq"] - 1
+        try:
+            self.coll.insert_one({"dim": dim, "value": value, "code": code})
+        except DuplicateKeyError:
+            # 其他 process 已先登記同一個值 => 用對方的代碼
+            code = self.coll.find_one({"dim": dim, "value": value})["code"]
+        self.codes[dim][value] = code
+        self.values[dim][code] = value
+        return code
+
+    def decode(self, dim, code):
+        if code is None:
+            return None
+        value = self.values[dim].get(code)
+        if value is None:
+            self.reload()
+            value = self.values[dim].get(code)
+        return value
+
+def ensure_luboil_indexes(db):
+    """luboil_data 的查詢索引: 依商品 + 時間 (csv_data_updater 的最大 timestamp、逐商品讀取)"""
+    db["luboil_data"].create_index([("productName", ASCENDING), ("timestamp", ASCENDING)])
+    db["luboil_data"].create_index([("timestamp", ASCENDING)])
+
+# luboil_meta { _id: "luboil_data", generation, months: { "2024-01": 筆數 } }:
+#   每次插入 luboil_data 後依月份累加筆數, delete_all_data 時世代 +1 並清空;
+#   snapshot_cache 讀這一筆就能判斷封存區間是否被改過, 不必掃描歷史資料
+def record_inserts(db, docs):
+    """插入 luboil_data (精簡格式) 之後呼叫"""
+    counts = {}
+    for doc in docs:
+        ts = doc.get("timestamp")
+        if isinstance(ts, datetime):
+            key = f"months.{ts:%Y-%m}"
+            counts[key] = counts.get(key, 0) + 1
+    if counts:
+        db[META_COLL].update_one({"_id": DATA_META_ID}, {"$inc": counts}, upsert=True)
+
+def reset_data_meta(db):
+    """清空 luboil_data 時呼叫"""
+    db[META_COLL].update_one(
+        {"_id": DATA_META_ID}, {"$inc": {"generation": 1}, "$unset": {"months": ""}}, upsert=True
+    )
+
+def load_data_meta(db):
+    """回傳 (generation, { 月份: 筆數 })"""
+    doc = db[META_COLL].find_one({"_id": DATA_META_ID}) or {}
+    return doc.get("generation", 0), doc.get("months", {})
+
+###############################
+#  2) 轉換函式                #
+###############################
+def parse_timestamp(value):
+    """ISO 字串 / datetime -> UTC datetime (offset-aware); 無法解析時丟 ValueError"""
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    date_str = str(value).strip()
+    if date_str.endswith("Z"):
+        date_str = date_str[:-1] + "+00:00"
+    elif "T" not in date_str:
+        date_str += "T00:00:00+00:00"
+    ts = datetime.fromisoformat(date_str)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+def _to_float(value):
+    if value is None or value == "":
+        return 0.0
+    return float(value)
+
+def text_or_none(value):
+    """字串欄位 (cardCode / productNumber) 的統一寫法: 空字串與 None 一律存成 None"""
+    if value is None or value == "":
+        return None
+    return value
+
+def _to_year_month(value):
+    if value is None or value == "":
+        return None
+    try:
+        return int(str(value).replace("-", "").replace("/", "").strip())
+    except ValueError:
+        return None
+
+def to_compact_doc(record, dims):
+    """
+    將一筆交易 (CSV 列 / JSON 紀錄 / 舊格式 doc) 轉成 schemaVersion 2 的精簡 doc
+    """
+    doc = {
+        "schemaVersion": SCHEMA_VERSION,
+        "productName": record.get("productName"),
+        "timestamp": parse_timestamp(record["timestamp"]),
+        "quantity": _to_float(record.get("quantity")),
+        "salesAmount": _to_float(record.get("salesAmount")),
+        "processYm": _to_year_month(record.get("processYm")),
+        "cardCode": text_or_none(record.get("cardCode")),
+        "productNumber": text_or_none(record.get("productNumber")),
+    }
+    for dim in DIMENSION_FIELDS:
+        if code_field(dim) in record:
+            doc[code_field(dim)] = record[code_field(dim)]
+        else:
+            doc[code_field(dim)] = dims.encode(dim, record.get(dim))
+    return doc
+
+def expand_doc(doc, dims):
+    """
+    精簡 doc -> 含原字串欄位的 doc (給彙總 / 特徵等需要名稱的地方);
+    舊格式 doc 原樣回傳
+    """
+    if doc.get("schemaVersion") != SCHEMA_VERSION:
+        return doc
+    expanded = dict(doc)
+    for dim in DIMENSION_FIELDS:
+        expanded[dim] = dims.decode(dim, doc.get(code_field(dim)))
+    return expanded
+
+def reader_projection(fields):
+    """查詢用 projection: 維度欄位同時取字串與代碼, 新舊格式都能讀"""
+    projection = {"_id": 0}
+    for field in fields:
+        projection[field] = 1
+        if field in DIMENSION_FIELDS:
+            projection[code_field(field)] = 1
+    projection["schemaVersion"] = 1
+    return projection
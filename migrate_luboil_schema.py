@@ -0,0 +1,66 @@
+import os
+import sys
+from pymongo import ASCENDING, ReplaceOne
+
+from mongo_io import get_db
+from luboil_schema import DimensionDictionary, SCHEMA_VERSION, to_compact_doc, ensure_luboil_indexes, record_inserts
+
+# 一次性 backfill: 把 luboil_data 的舊格式 doc (ISO 字串 timestamp、重複長字串維度、_importUUID)
+# 改寫成 schemaVersion 2 的精簡格式. 依 _id 分批處理, 中斷後重跑會從未轉換的 doc 繼續
+# 用法: python migrate_luboil_schema.py [batch_size, 預設 5000]
+
+def backfill(db, batch_size=5000):
+    dims = DimensionDictionary(db)
+    dims.ensure_indexes()
+    collection = db["luboil_data"]
+
+    query = {"schemaVersion": {"$ne": SCHEMA_VERSION}}
+    converted = 0
+    skipped = 0
+    last_id = None
+
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        batch = list(collection.find(batch_query).sort("_id", ASCENDING).limit(batch_size))
+        if not batch:
+            break
+
+        operations = []
+        new_docs = []
+        for old_doc in batch:
+            try:
+                new_doc = to_compact_doc(old_doc, dims)
+            except (KeyError, ValueError) as e:
+                print(f"[WARN] Skip {old_doc['_id']}: {e}")
+                skipped += 1
+                continue
+            new_doc["_id"] = old_doc["_id"]
+            operations.append(ReplaceOne({"_id": old_doc["_id"]}, new_doc))
+            new_docs.append(new_doc)
+
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+            # 舊格式 doc 插入時沒有計入 luboil_meta, 轉換後才計入
+            record_inserts(db, new_docs)
+        converted += len(operations)
+        last_id = batch[-1]["_id"]
+        print(f"[INFO] Converted {converted} docs (skipped {skipped}) ...")
+
+    ensure_luboil_indexes(db)
+    return converted, skipped
+
+def main():
+    MONGODB_URI = os.getenv("MONGODB_URI")
+    if not MONGODB_URI:
+        raise ValueError("No MONGODB_URI in environment variables")
+
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print("=== [migrate_luboil_schema.py] START ===")
+    converted, skipped = backfill(get_db(MONGODB_URI), batch_size)
+    print(f"Backfill done. Converted: {converted}, skipped={skipped}")
+    print("=== [migrate_luboil_schema.py] END ===")
+
+if __name__ == "__main__":
+    main()
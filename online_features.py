@@ -0,0 +1,323 @@
+import os
+from collections import deque
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, UpdateOne
+
+from mongo_io import get_db
+from luboil_schema import DimensionDictionary, expand_doc, parse_timestamp
+
+# 線上 (incremental) 特徵引擎:
+#   每筆交易只用「它之前」的交易計算特徵 (不會偷看到自己或未來), 再把自己加進狀態,
+#   所以每天 append 新 CSV 只需處理新交易, 不必整段重算 groupby.
+#   - expanding 平均: salesPerson / custPlace / cardCode 的累計 sum / count
+#   - trailing 平均: 最近 FEATURE_TRAILING_DAYS 天, 以「日」為桶 (過期的桶從左邊移出, 最多 N 個桶)
+#   - rolling_avg_quantity_7: 該商品前 7 筆交易的平均
+# 每筆更新為 O(1) (trailing 視窗移出為攤銷 O(1)). 狀態分兩個 collection:
+#   online_feature_state  每個商品一筆 (最近 7 筆 quantity, last_timestamp), 大小固定
+#   online_feature_keys   每個 (商品, 群組, key) 一筆 count / total (+ trailing 日桶)
+# 每批只讀寫這批交易用到的 key, count / total 以 $inc 累加, 不會整份狀態讀出再覆寫
+
+# 特徵 / 訓練的日期區間 (update_and_retrain_all, chunked 版本共用).
+# 線上狀態從 FEATURE_START_DATE 起累計, 不受 FEATURE_END_DATE 限制 (之後 append 的資料照樣更新);
+# FEATURE_END_DATE 只在取出訓練資料時截斷
+FEATURE_START_DATE = os.getenv("FEATURE_START_DATE", "2023-01-01")
+FEATURE_END_DATE = os.getenv("FEATURE_END_DATE", "2024-11-30")
+FEATURE_TRAILING_DAYS = int(os.getenv("FEATURE_TRAILING_DAYS", "90"))
+
+STATE_COLL = "online_feature_state"
+KEYS_COLL = "online_feature_keys"
+FEATURES_COLL = "online_features"
+ROLLING_WINDOW = 7
+CUST_PLACES = {"custPlace_南區": "南區", "custPlace_中區": "中區", "custPlace_北區": "北區"}
+GROUP_KEYS = {"salesperson": "salesPerson", "custplace": "custPlace", "cardcode": "cardCode"}
+SALES_GROUP = "sales_per_person"  # avg_sales_per_salesperson 只需 expanding 平均
+
+def feature_window(start_date=None, end_date=None):
+    """回傳 (start, end) datetime, 預設為 FEATURE_START_DATE / FEATURE_END_DATE"""
+    start = datetime.fromisoformat(start_date or FEATURE_START_DATE)
+    end = datetime.fromisoformat(end_date or FEATURE_END_DATE)
+    return start, end
+
+###############################
+#  1) 累計器                  #
+###############################
+class Mean:
+    """單一 key 的 expanding 平均 (只存 count / total)"""
+
+    __slots__ = ("count", "total")
+
+    def __init__(self, count=0, total=0.0):
+        self.count = count
+        self.total = total
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+
+class RunningMean(Mean):
+    """expanding 平均 + trailing N 天平均; trailing 視窗為 [日期序號, 筆數, 合計] 日桶"""
+
+    __slots__ = ("window", "window_count", "window_total")
+
+    def __init__(self, count=0, total=0.0, window=()):
+        super().__init__(count, total)
+        self.window = deque([int(day), int(n), float(s)] for day, n, s in window)
+        self.window_count = sum(b[1] for b in self.window)
+        self.window_total = sum(b[2] for b in self.window)
+
+    def trailing_mean(self, day, days):
+        # 移出超過視窗的舊桶
+        while self.window and self.window[0][0] <= day - days:
+            _, n, s = self.window.popleft()
+            self.window_count -= n
+            self.window_total -= s
+        return self.window_total / self.window_count if self.window_count else 0.0
+
+    def add(self, day, value):
+        super().add(value)
+        if self.window and self.window[-1][0] == day:
+            self.window[-1][1] += 1
+            self.window[-1][2] += value
+        else:
+            self.window.append([day, 1, value])
+        self.window_count += 1
+        self.window_total += value
+
+###############################
+#  2) 單一商品的特徵引擎      #
+###############################
+class OnlineFeatureEngine:
+
+    def __init__(self, productName, trailing_days=FEATURE_TRAILING_DAYS):
+        self.productName = productName
+        self.trailing_days = trailing_days
+        self.groups = {name: {} for name in GROUP_KEYS}
+        self.sales_per_person = {}
+        self.recent = deque(maxlen=ROLLING_WINDOW)
+        self.last_timestamp = None
+        # (群組, key) => [本批新增筆數, 本批新增合計]; save_engine 以 $inc 寫回
+        self.changes = {}
+
+    def _group(self, name, key):
+        table = self.groups[name]
+        rm = table.get(key)
+        if rm is None:
+            rm = table[key] = RunningMean()
+        return rm
+
+    def _record(self, group, key, value):
+        change = self.changes.setdefault((group, key), [0, 0.0])
+        change[0] += 1
+        change[1] += value
+
+    def update(self, txn):
+        """
+        txn: {timestamp (datetime), quantity, salesAmount, salesPerson, custPlace, cardCode}
+        回傳這筆交易的特徵 (只用之前的交易), 再把它併入狀態
+        """
+        ts = txn["timestamp"]
+        day = ts.toordinal()
+        quantity = float(txn.get("quantity") or 0.0)
+        sales_amount = float(txn.get("salesAmount") or 0.0)
+
+        features = {"促銷期": int(ts.year == 2024 and ts.month in (3, 4, 5))}
+        for col, place in CUST_PLACES.items():
+            features[col] = int(txn.get("custPlace") == place)
+
+        for name, field in GROUP_KEYS.items():
+            key = txn.get(field)
+            if key is None:
+                features[f"avg_quantity_per_{name}"] = 0.0
+                features[f"trailing_avg_quantity_per_{name}"] = 0.0
+                continue
+            rm = self._group(name, key)
+            features[f"avg_quantity_per_{name}"] = rm.mean()
+            features[f"trailing_avg_quantity_per_{name}"] = rm.trailing_mean(day, self.trailing_days)
+
+        person = txn.get("salesPerson")
+        sales_mean = self.sales_per_person.get(person) if person is not None else None
+        features["avg_sales_per_salesperson"] = sales_mean.mean() if sales_mean else 0.0
+
+        # 與批次版本欄位名稱一致
+        features["avg_quantity_per_customer"] = features["avg_quantity_per_custplace"]
+        features["rolling_avg_quantity_7"] = (
+            sum(self.recent) / ROLLING_WINDOW if len(self.recent) == ROLLING_WINDOW else 0.0
+        )
+
+        # 併入狀態
+        for name, field in GROUP_KEYS.items():
+            key = txn.get(field)
+            if key is not None:
+                self._group(name, key).add(day, quantity)
+                self._record(name, key, quantity)
+        if person is not None:
+            if sales_mean is None:
+                sales_mean = self.sales_per_person[person] = Mean()
+            sales_mean.add(sales_amount)
+            self._record(SALES_GROUP, person, sales_amount)
+        self.recent.append(quantity)
+        self.last_timestamp = ts
+        return features
+
+    def to_dict(self):
+        """商品層級的狀態 (固定大小); 各 key 的累計器另存於 online_feature_keys"""
+        return {
+            "productName": self.productName,
+            "trailing_days": self.trailing_days,
+            "recent": list(self.recent),
+            "last_timestamp": self.last_timestamp,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        engine = cls(d["productName"], d.get("trailing_days", FEATURE_TRAILING_DAYS))
+        engine.recent.extend(d["recent"])
+        engine.last_timestamp = d.get("last_timestamp")
+        return engine
+
+###############################
+#  3) 與 MongoDB 串接         #
+###############################
+def _key_id(productName, group, key):
+    return {"productName": productName, "group": group, "key": key}
+
+def load_engine(db, productName, txns=()):
+    """讀商品狀態, 以及這批交易會用到的 key 的累計器 (不讀該商品其他 key)"""
+    state = db[STATE_COLL].find_one({"_id": productName})
+    engine = OnlineFeatureEngine.from_dict(state["state"]) if state else OnlineFeatureEngine(productName)
+
+    keys = set()
+    for txn in txns:
+        for name, field in GROUP_KEYS.items():
+            if txn.get(field) is not None:
+                keys.add((name, txn[field]))
+        if txn.get("salesPerson") is not None:
+            keys.add((SALES_GROUP, txn["salesPerson"]))
+    if keys:
+        ids = [_key_id(productName, group, key) for group, key in keys]
+        for doc in db[KEYS_COLL].find({"_id": {"$in": ids}}):
+            group, key = doc["_id"]["group"], doc["_id"]["key"]
+            if group == SALES_GROUP:
+                engine.sales_per_person[key] = Mean(doc["count"], doc["total"])
+            else:
+                engine.groups[group][key] = RunningMean(doc["count"], doc["total"], doc.get("window", []))
+    return engine
+
+def save_engine(db, engine):
+    """
+    商品狀態整筆覆寫 (固定大小); 本批有變動的 key 以 $inc 累加 count / total,
+    trailing 日桶先移出過期的再 $set (最多 trailing_days 個桶)
+    """
+    db[STATE_COLL].replace_one({"_id": engine.productName}, {"_id": engine.productName, "state": engine.to_dict()}, upsert=True)
+
+    last_day = engine.last_timestamp.toordinal() if engine.last_timestamp is not None else None
+    operations = []
+    for (group, key), (count, total) in engine.changes.items():
+        update = {"$inc": {"count": count, "total": total}}
+        if group != SALES_GROUP:
+            rm = engine.groups[group][key]
+            if last_day is not None:
+                rm.trailing_mean(last_day, engine.trailing_days)
+            update["$set"] = {"window": [list(b) for b in rm.window]}
+        operations.append(UpdateOne({"_id": _key_id(engine.productName, group, key)}, update, upsert=True))
+    if operations:
+        db[KEYS_COLL].bulk_write(operations, ordered=False)
+    engine.changes = {}
+
+def missing_online_state(db, productNames):
+    """FEATURE_START_DATE 之後有交易、卻沒有線上特徵狀態的商品 (尚未執行 rebuild)"""
+    start, _ = feature_window()
+    have = {doc["_id"] for doc in db[STATE_COLL].find({"_id": {"$in": list(productNames)}}, {"_id": 1})}
+    return [
+        productName for productName in productNames
+        if productName not in have
+        and db["luboil_data"].find_one({"productName": productName, "timestamp": {"$gte": start}}, {"_id": 1})
+    ]
+
+def update_features_from_docs(db, docs, dims=None):
+    """
+    將新插入的交易依商品、時間順序餵給各自的引擎, 特徵列寫入 online_features,
+    最後存回引擎狀態. 回傳 { productName: 新增特徵筆數 }
+    """
+    dims = dims or DimensionDictionary(db)
+    start, _ = feature_window()
+
+    by_product = {}
+    for doc in docs:
+        doc = expand_doc(doc, dims)
+        if not doc.get("productName") or not doc.get("timestamp"):
+            continue
+        ts = parse_timestamp(doc["timestamp"]).replace(tzinfo=None)
+        if ts < start:
+            continue
+        by_product.setdefault(doc["productName"], []).append(dict(doc, timestamp=ts))
+
+    db[FEATURES_COLL].create_index([("productName", ASCENDING), ("timestamp", ASCENDING)])
+    counts = {}
+    for productName, txns in by_product.items():
+        txns.sort(key=lambda t: t["timestamp"])  # stable: 同一天維持插入順序
+        engine = load_engine(db, productName, txns)
+        if engine.last_timestamp is not None and txns[0]["timestamp"] < engine.last_timestamp:
+            print(f"[WARN] {productName} receives transactions older than its feature state, appended in arrival order.")
+
+        rows = []
+        for txn in txns:
+            features = engine.update(txn)
+            features.update({"productName": productName, "timestamp": txn["timestamp"], "quantity": float(txn.get("quantity") or 0.0)})
+            rows.append(features)
+        if rows:
+            db[FEATURES_COLL].insert_many(rows, ordered=True)
+        save_engine(db, engine)
+        counts[productName] = len(rows)
+    return counts
+
+def load_online_features(db, productName, feature_cols, start_date=None, end_date=None):
+    """讀取某商品在日期區間內的線上特徵 => (X list of list, y list), 欄位順序依 feature_cols"""
+    start, end = feature_window(start_date, end_date)
+    # 特徵列存的是當天 00:00 以後的時間, 結束日要含整天
+    end = end + timedelta(days=1)
+    cursor = db[FEATURES_COLL].find(
+        {"productName": productName, "timestamp": {"$gte": start, "$lt": end}},
+        {"_id": 0, "quantity": 1, **{c: 1 for c in feature_cols}}
+    ).sort([("timestamp", ASCENDING), ("_id", ASCENDING)])
+    X, y = [], []
+    for row in cursor:
+        X.append([row.get(c, 0.0) for c in feature_cols])
+        y.append(row["quantity"])
+    return X, y
+
+def rebuild_online_features(db):
+    """清空狀態與特徵列, 從 luboil_data 全部重新計算 (初次建立或調整視窗後使用)"""
+    db[STATE_COLL].delete_many({})
+    db[KEYS_COLL].delete_many({})
+    db[FEATURES_COLL].delete_many({})
+    cursor = db["luboil_data"].find({}).sort([("timestamp", ASCENDING), ("_id", ASCENDING)])
+    dims = DimensionDictionary(db)
+    batch, total = [], {}
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= 50000:
+            for k, v in update_features_from_docs(db, batch, dims).items():
+                total[k] = total.get(k, 0) + v
+            batch = []
+    if batch:
+        for k, v in update_features_from_docs(db, batch, dims).items():
+            total[k] = total.get(k, 0) + v
+    return total
+
+def main():
+    MONGODB_URI = os.getenv("MONGODB_URI")
+    if not MONGODB_URI:
+        raise ValueError("No MONGODB_URI in environment variables")
+
+    print("=== [online_features.py] START ===")
+    counts = rebuild_online_features(get_db(MONGODB_URI))
+    print(f"Online features rebuilt: {counts}")
+    print("=== [online_features.py] END ===")
+
+if __name__ == "__main__":
+    main()
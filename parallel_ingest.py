@@ -0,0 +1,220 @@
+import os
+import io
+import csv
+import time
+import warnings
+from collections import deque
+from datetime import datetime
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from luboil_schema import SCHEMA_VERSION, DIMENSION_FIELDS, code_field, parse_timestamp, text_or_none, record_inserts
+from data_quality import EXTRA_COL, frame_from_records, check_rows, check_batch, quarantine_docs, write_quarantine
+
+# csv_data_updater 的平行匯入模式 (PARALLEL_INGEST=1):
+#   解析階段: process pool, 每個 task = 一個 CSV 檔或大檔的一段 byte range,
+#             用 pandas C parser (有裝 pyarrow 時用 pyarrow engine) 一次解析整段,
+#             再做逐列的資料品質檢查 (data_quality.check_rows)
+#   寫入階段: 單一 writer (主 process), 一個檔案的各段到齊後才做整檔的檢查
+#             (PRICE_OUTLIER / DUPLICATE, 結果不受 INGEST_CHUNK_BYTES 影響, 與逐檔模式相同),
+#             再依檔案順序比對各商品 DB 最大 timestamp, 編維度代碼後分批 insert_many
+#   記憶體: writer 保留目前檔案已解析的各段 (整檔檢查需要), 加上最多 INGEST_MAX_IN_FLIGHT 段
+#           尚未寫入的解析結果 (送出的 task 數有上限, 不會整批排在 queue 裡)
+# byte range 以換行切齊, 假設 ERP 匯出的欄位內沒有換行.
+# 表頭與內容都用 CSV 規則解析 (可加引號), 欄位數比表頭多的列放進 _extraFields (EXTRA_FIELDS),
+# 與逐檔模式 csv.DictReader + frame_from_records 的結果相同
+
+CHUNK_BYTES = int(os.getenv("INGEST_CHUNK_BYTES", str(64 * 1024 * 1024)))
+WRITE_BATCH = int(os.getenv("INGEST_WRITE_BATCH", "10000"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", "0")) or 2 * INGEST_WORKERS
+
+EPOCH = datetime.fromisoformat("1900-01-01T00:00:00+00:00")
+
+def _csv_engine():
+    try:
+        import pyarrow  # noqa: F401
+        return "pyarrow"
+    except ImportError:
+        return "c"
+
+###############################
+#  1) 切分 task               #
+###############################
+def plan_tasks(csv_files, chunk_bytes=CHUNK_BYTES):
+    """回傳 [(file, start, end, chunk_no)], 依檔案順序; 小檔一個 task, 大檔依換行切成多段"""
+    tasks = []
+    for csv_file in csv_files:
+        size = os.path.getsize(csv_file)
+        with open(csv_file, "rb") as f:
+            header_end = len(f.readline())
+            start = header_end
+            chunk_no = 0
+            while start < size:
+                end = min(start + chunk_bytes, size)
+                if end < size:
+                    f.seek(end)
+                    end += len(f.readline())  # 切到下一個換行之後
+                tasks.append((csv_file, start, end, chunk_no))
+                start = end
+                chunk_no += 1
+    return tasks
+
+###############################
+#  2) 解析 + 驗證 (worker)     #
+###############################
+def read_header(csv_file):
+    with open(csv_file, "rb") as f:
+        return next(csv.reader([f.readline().decode("utf-8-sig")]))
+
+def read_chunk(csv_file, start, end):
+    header = read_header(csv_file)
+    with open(csv_file, "rb") as f:
+        f.seek(start)
+        payload = f.read(end - start)
+
+    # 一般情況: 整段交給 C / pyarrow parser. 有列的欄位數比表頭多時 (pandas 會報錯或丟掉資料),
+    # 這一段改用 csv.DictReader 解析, 多出的欄位由 frame_from_records 放進 _extraFields
+    engine = _csv_engine()
+    options = {} if engine == "pyarrow" else {"index_col": False}  # pyarrow 本身就拒絕欄位數不一致的列
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", pd.errors.ParserWarning)
+            raw = pd.read_csv(
+                io.BytesIO(payload), names=header, header=None, dtype=str,
+                keep_default_na=False, engine=engine, **options
+            ).fillna("")
+    except (pd.errors.ParserError, pd.errors.ParserWarning, ValueError):
+        rows = list(csv.DictReader(io.StringIO(payload.decode("utf-8")), fieldnames=header))
+        return frame_from_records(rows)
+    raw[EXTRA_COL] = ""
+    return raw
+
+def parse_task(task):
+    """解析一段 CSV 並做逐列的資料品質檢查; 回傳 (原始字串列, typed 列, flags)"""
+    csv_file, start, end, chunk_no = task
+    raw = read_chunk(csv_file, start, end)
+    typed, flags = check_rows(raw)
+    return csv_file, chunk_no, raw, typed, flags
+
+###############################
+#  3) writer                  #
+###############################
+def frame_to_docs(df, dims):
+    """DataFrame -> schemaVersion 2 精簡 doc (同 luboil_schema.to_compact_doc)"""
+    out = pd.DataFrame({
+        "schemaVersion": SCHEMA_VERSION,
+        "productName": df["productName"],
+        "timestamp": df["timestamp"],
+        "quantity": df["quantity"].astype(float),
+        "salesAmount": df["salesAmount"].astype(float),
+        "processYm": df["processYm"],
+        "cardCode": df["cardCode"],
+        "productNumber": df["productNumber"],
+    })
+    for dim in DIMENSION_FIELDS:
+        # 每批只對「不重複的值」查代碼
+        codes = {value: dims.encode(dim, value) for value in df[dim].dropna().unique()}
+        out[code_field(dim)] = df[dim].map(codes)
+
+    out = out.astype(object).where(out.notna(), None)
+    docs = out.to_dict(orient="records")
+    for doc in docs:
+        doc["timestamp"] = doc["timestamp"].to_pydatetime()
+        if doc["processYm"] is not None:
+            doc["processYm"] = int(doc["processYm"])
+        doc["cardCode"] = text_or_none(doc["cardCode"])
+        doc["productNumber"] = text_or_none(doc["productNumber"])
+        for dim in DIMENSION_FIELDS:
+            if doc[code_field(dim)] is not None:
+                doc[code_field(dim)] = int(doc[code_field(dim)])
+    return docs
+
+def get_max_ts(db, productNames):
+    result = {}
+    for productName in productNames:
+        latest = db.luboil_data.find_one({"productName": productName}, sort=[("timestamp", -1)], projection={"timestamp": 1})
+        result[productName] = parse_timestamp(latest["timestamp"]) if latest else EPOCH
+    return result
+
+def write_batches(db, docs, batch_size=WRITE_BATCH):
+    for i in range(0, len(docs), batch_size):
+        db.luboil_data.insert_many(docs[i:i + batch_size], ordered=False)
+        record_inserts(db, docs[i:i + batch_size])
+
+def _ordered_results(pool, tasks, max_in_flight):
+    """
+    依 task 順序 (= 檔案順序) 取回解析結果, 解析仍是平行進行;
+    同時送出的 task 最多 max_in_flight 個 (imap 會把所有完成的結果排在 queue 裡, 記憶體沒有上限)
+    """
+    pending = deque()
+    task_iter = iter(tasks)
+    for task in task_iter:
+        pending.append(pool.apply_async(parse_task, (task,)))
+        if len(pending) >= max_in_flight:
+            break
+    while pending:
+        result = pending.popleft().get()
+        for task in task_iter:
+            pending.append(pool.apply_async(parse_task, (task,)))
+            break
+        yield result
+
+def run(db, csv_files, dims, on_file_done=None, workers=INGEST_WORKERS):
+    """
+    平行解析 + 單一 writer. 與逐檔模式相同的語意:
+      整個檔案做資料品質檢查, 每個檔案寫入前查一次各商品 DB 最大 timestamp, 只寫入比它新的列
+    on_file_done(csv_file, docs): 每個檔案寫完後呼叫 (彙總表 / 線上特徵)
+    回傳 (inserted, skipped, quarantined)
+    """
+    tasks = plan_tasks(csv_files)
+    n_chunks = {}
+    for csv_file, _, _, _ in tasks:
+        n_chunks[csv_file] = n_chunks.get(csv_file, 0) + 1
+    print(f"[INFO] {len(csv_files)} files => {len(tasks)} parse tasks on {workers} workers ({_csv_engine()} engine)")
+
+    t0 = time.perf_counter()
+    inserted = 0
+    skipped = 0
+    quarantined = {}
+    rows_seen = 0
+    parts = []
+
+    with Pool(workers) as pool:
+        for csv_file, chunk_no, raw, typed, flags in _ordered_results(pool, tasks, MAX_IN_FLIGHT):
+            rows_seen += len(raw)
+            parts.append((raw, typed, flags))
+            if chunk_no < n_chunks[csv_file] - 1:
+                continue
+
+            # 檔案的最後一段: 合併後做整檔的檢查
+            if len(parts) > 1:
+                raw = pd.concat([p[0] for p in parts], ignore_index=True)
+                typed = pd.concat([p[1] for p in parts], ignore_index=True)
+                flags = np.concatenate([p[2] for p in parts])
+            parts = []
+            flags = flags | check_batch(raw, typed)
+            for code, count in write_quarantine(db, quarantine_docs(raw, flags, source=csv_file)).items():
+                quarantined[code] = quarantined.get(code, 0) + count
+
+            df = typed[flags == 0].reset_index(drop=True)
+            docs = []
+            if len(df):
+                max_ts = get_max_ts(db, df["productName"].unique())
+                limit = df["productName"].map({k: pd.Timestamp(v) for k, v in max_ts.items()})
+                newer = (df["timestamp"] > limit).to_numpy()
+                skipped += int((~newer).sum())
+                docs = frame_to_docs(df[newer], dims)
+                write_batches(db, docs)
+                inserted += len(docs)
+
+            if on_file_done and docs:
+                on_file_done(csv_file, docs)
+            print(f"Done {csv_file}, inserted so far: {inserted}, skipped={skipped}")
+
+    elapsed = time.perf_counter() - t0
+    rate = rows_seen / elapsed if elapsed > 0 else 0.0
+    print(f"[INFO] Parallel ingest: {rows_seen} rows in {elapsed:.2f}s => {rate:,.0f} rows/sec")
+    return inserted, skipped, quarantined
@@ -1,27 +1,36 @@
 import pandas as pd
-from prophet import Prophet
-from pymongo import MongoClient
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 
-def get_data_from_mongodb():
+from snapshot_cache import snapshot_enabled, load_history
+from forecast_cache import get_forecast_cache
+from prediction_intervals import INTERVAL_WIDTH, INTERVAL_METHOD, INTERVAL_SAMPLES, sample_forecast, attach_bands, sample_docs, save_samples, samples_coll
+from mongo_io import get_db, find_docs, async_find_docs, async_replace_product_docs, run_per_product
+
+def get_data_from_mongodb(productNames=None):
     """
     從MongoDB獲取「潤滑油資料」，欄位為:
      - productName
      - timestamp
      - quantity
     (若實際 collection/欄位名不同，請自行調整)
+    productNames: 只取指定商品 (None = 全部)
     """
-    client = MongoClient(os.getenv("MONGODB_URI"))
-    db = client["luboil_data_db"]
-    collection = db["luboil_data"]
+    # LUBOIL_SNAPSHOT=1 => 封存月份讀本機 Parquet, 只向 MongoDB 取 watermark 之後的資料
+    if snapshot_enabled():
+        df = load_history(productNames)[["productName", "timestamp", "quantity"]]
+        df["productName"] = df["productName"].astype(object)
+        return df.to_dict(orient="records")
+
     #取出欄位
-    data = list(collection.find({}, {
+    query = {"productName": {"$in": list(productNames)}} if productNames else {}
+    data = find_docs("luboil_data", query, {
         "_id": 0, 
         "productName": 1, 
         "timestamp": 1, 
         "quantity": 1
-    }))
+    })
     return data
 
 def predict_quantity_monthly(data, periods = 5, freq = "MS"):
@@ -32,7 +41,8 @@ def predict_quantity_monthly(data, periods = 5, freq = "MS"):
     df = pd.DataFrame(data)
 
     # 1)將timestamp轉換為datetime格式
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors = "coerce")
+    # timestamp 可能是 BSON date (精簡格式) 或 ISO 字串 (舊格式), 一律視為 UTC
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors = "coerce", utc=True)
     if df["timestamp"].isnull().any():
         raise ValueError("Some timestamps could not be parsed. Please check your data.")
     
@@ -52,20 +62,36 @@ def predict_quantity_monthly(data, periods = 5, freq = "MS"):
 
     if grouped.empty:
         raise ValueError("No valid data after grouping - possibly empty dataset")
-    # 4) 建立 Prophet 模型並訓練
-    model = Prophet(interval_width=0.8)
-    model.fit(grouped)
-
-    # 5) 建立未來時間範圍
-    future = model.make_future_dataframe(periods=periods, freq=freq)
-    forecast = model.predict(future)
+    def fit_and_forecast():
+        # Prophet 載入很慢, 真的要訓練時才 import (預測快取命中時不必載入)
+        from prophet import Prophet
+
+        # 4) 建立 Prophet 模型並訓練
+        model = Prophet(interval_width=INTERVAL_WIDTH, uncertainty_samples=INTERVAL_SAMPLES)
+        model.fit(grouped)
+
+        # 5) 建立未來時間範圍
+        future = model.make_future_dataframe(periods=periods, freq=freq)
+        horizon = future.iloc[-periods:].reset_index(drop=True)
+
+        # 只對最後 'periods' 筆預測; 保存抽樣, 區間 / 分位數之後從抽樣計算 (見 prediction_intervals.py)
+        yhat, samples = sample_forecast(model, horizon)
+        return [
+            {"ds": ds, "yhat": float(y), "samples": s.tolist()}
+            for ds, y, s in zip(horizon["ds"], yhat, samples)
+        ]
 
-    # 取最後 'periods' 筆預測結果
-    future_forecast = forecast.iloc[-periods:][["ds", "yhat", "yhat_lower", "yhat_upper"]]
-    return future_forecast.to_dict(orient="records")
+    # 彙總序列 / 參數都沒變時直接用上次的預測 (見 forecast_cache.py)
+    # 區間寬度不影響抽樣, 不放進 key => 換 interval_width 不會重 fit
+    config = {"model": "prophet", "interval_method": INTERVAL_METHOD, "samples": INTERVAL_SAMPLES}
+    records = get_forecast_cache().get_or_compute(grouped, periods, freq, config, fit_and_forecast)
+    return attach_bands(records)
 
-def insert_future_predictions_to_mongodb(predictions):
-    """將預測數據插入到MongoDB"""
+def insert_future_predictions_to_mongodb(predictions, productNames=None):
+    """
+    將預測數據插入到MongoDB
+    productNames: 只替換指定商品的舊預測 (None = 全部刪除重寫)
+    """
     # 轉換字段名稱
     for prediction in predictions:
       prediction["timestamp"] = prediction.pop("ds")
@@ -73,26 +99,28 @@ def insert_future_predictions_to_mongodb(predictions):
       prediction["lower_bound"] = prediction.pop("yhat_lower")
       prediction["upper_bound"] = prediction.pop("yhat_upper")
 
-    client = MongoClient(os.getenv("MONGODB_URI"))
-    db = client["luboil_data_db"]
-    collection = db["future_quantity_monthly"]
+    # 抽樣另存到 future_quantity_monthly_samples, 之後可不重 fit 重算任意分位數
+    save_samples(get_db(), "future_quantity_monthly", sample_docs(predictions), productNames)
+
+    collection = get_db()["future_quantity_monthly"]
 
     # 刪除舊數據
-    collection.delete_many({})
+    if productNames:
+        collection.delete_many({"productName": {"$in": list(productNames)}})
+    else:
+        collection.delete_many({})
     print("Old future data deleted")
 
     # 插入新數據
     collection.insert_many(predictions)
     print("New monthly future quantity data inserted.")
 
-if __name__ == "__main__":
-    # 1) 從 MongoDB獲取原始數據
-    raw_data = get_data_from_mongodb()
-
-    #2) 建立一個存放所有預測結果的清單
+def build_future_predictions_monthly(raw_data):
+    """
+    依 productName 分組, 對每個商品跑月預測, 回傳加上 productName 的預測清單
+    """
     all_predictions = []
 
-    # 3) 依 productName分組
     product_names =set(item["productName"] for item in raw_data if "productName" in item)
     
 
@@ -116,10 +144,74 @@ if __name__ == "__main__":
         # 加到總 predictions
         all_predictions.extend(future_data)
 
+    return all_predictions
+
+def build_and_write_predictions_async(productNames, max_workers=4):
+    """
+    async 版本: 各商品的讀取同時發出, Prophet 訓練在 thread pool 中進行,
+    前一個商品的結果在背景寫回 future_quantity_monthly, 與下一個商品的訓練重疊
+    (設定 ASYNC_IO=1 時使用, 需安裝 motor)
+    """
+    async def fetch(productName):
+        return await async_find_docs("luboil_data", {"productName": productName}, {
+            "_id": 0,
+            "timestamp": 1,
+            "quantity": 1
+        })
+
+    def compute(productName, product_data):
+        future_data = predict_quantity_monthly(product_data, periods=5, freq="MS")
+        for row in future_data:
+            row["productName"] = productName
+            row["ds"] = row["ds"].isoformat() + "Z"
+        return future_data
+
+    async def write(productName, future_data):
+        docs = [{
+            "productName": row["productName"],
+            "timestamp": row["ds"],
+            "quantity": row["yhat"],
+            "lower_bound": row["yhat_lower"],
+            "upper_bound": row["yhat_upper"],
+            "quantiles": row["quantiles"]
+        } for row in future_data]
+        samples = [{
+            "productName": row["productName"],
+            "timestamp": row["ds"],
+            "samples": row["samples"]
+        } for row in future_data]
+        await async_replace_product_docs(samples_coll("future_quantity_monthly"), productName, samples)
+        await async_replace_product_docs("future_quantity_monthly", productName, docs)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = run_per_product(productNames, fetch, compute, write, executor)
+
+    all_predictions = []
+    for productName in productNames:
+        all_predictions.extend(results[productName])
+    return all_predictions
+
+def main():
+    if os.getenv("ASYNC_IO") == "1":
+        # 讀取 / 訓練 / 寫回重疊進行, 寫回已在 async 流程中完成
+        product_names = get_db()["luboil_data"].distinct("productName")
+        all_predictions = build_and_write_predictions_async(product_names)
+    else:
+        # 1) 從 MongoDB獲取原始數據
+        raw_data = get_data_from_mongodb()
+
+        #2) 建立一個存放所有預測結果的清單
+        all_predictions = build_future_predictions_monthly(raw_data)
+
     # 5) 保存預測數據寫入 JSON檔
     with open("future_quantity_monthly.json", "w", encoding="utf-8") as f:
-        json.dump(all_predictions, f, indent=4, ensure_ascii=False)
+        json.dump([{k: v for k, v in p.items() if k != "samples"} for p in all_predictions], f, indent=4, ensure_ascii=False)
     print("Future monthly predictions saved to future_quantity_monthly.json.")
+    print(f"Forecast cache: {get_forecast_cache().stats()}")
 
     # 寫回 MongoDB
-    insert_future_predictions_to_mongodb(all_predictions)
\ No newline at end of file
+    if os.getenv("ASYNC_IO") != "1":
+        insert_future_predictions_to_mongodb(all_predictions)
+
+if __name__ == "__main__":
+    main()
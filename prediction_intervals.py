@@ -0,0 +1,132 @@
+import os
+import sys
+
+import numpy as np
+from pymongo import UpdateOne
+
+from mongo_io import get_db
+
+# 預測區間引擎: 預測時保存每個未來時間點的抽樣 (samples), 之後任意分位數都從抽樣直接算,
+# 不必為了換 interval_width (例如安全庫存要 95%) 重新 fit Prophet.
+#   posterior (預設) Prophet predictive_samples 的後驗預測抽樣
+#   bootstrap        yhat + 重抽樣的 in-sample 殘差 (較快, 不含趨勢不確定性)
+# 抽樣存在 <預測 collection>_samples (future_quantity_data_samples / future_quantity_monthly_samples),
+# 各分位數寫在預測 doc 的 quantiles 欄位, lower_bound / upper_bound 依 INTERVAL_WIDTH
+# 用法 (不重 fit, 重算已存預測的區間): python prediction_intervals.py future_quantity_data 0.95
+
+INTERVAL_METHOD = os.getenv("INTERVAL_METHOD", "posterior")
+INTERVAL_SAMPLES = int(os.getenv("INTERVAL_SAMPLES", "1000"))
+INTERVAL_WIDTH = float(os.getenv("INTERVAL_WIDTH", "0.8"))
+QUANTILES = [float(q) for q in os.getenv("FORECAST_QUANTILES", "0.025,0.05,0.1,0.5,0.9,0.95,0.975").split(",")]
+
+def samples_coll(coll_name):
+    return coll_name + "_samples"
+
+def quantile_key(q):
+    """0.025 -> 'p2_5', 0.9 -> 'p90' (MongoDB 欄位名稱不能有 '.')"""
+    return "p" + f"{q * 100:g}".replace(".", "_")
+
+###############################
+#  1) 產生抽樣                #
+###############################
+def residual_bootstrap(yhat, residuals, n_samples=INTERVAL_SAMPLES, seed=42):
+    """(periods,) yhat + 重抽樣殘差 => (periods, n_samples)"""
+    rng = np.random.default_rng(seed)
+    residuals = np.asarray(residuals, dtype=np.float64)
+    residuals = residuals[np.isfinite(residuals)]
+    if len(residuals) == 0:
+        return np.repeat(np.asarray(yhat, dtype=np.float64)[:, None], n_samples, axis=1)
+    return np.asarray(yhat, dtype=np.float64)[:, None] + rng.choice(residuals, size=(len(yhat), n_samples))
+
+def sample_forecast(model, horizon, method=INTERVAL_METHOD, n_samples=INTERVAL_SAMPLES):
+    """
+    model: 已 fit 的 Prophet; horizon: 只含未來時間點的 ds DataFrame
+    回傳 (yhat (periods,), samples (periods, n_samples))
+    predict 時關掉 Prophet 內建抽樣 (只算 yhat), 抽樣只對 horizon 做一次
+    """
+    model.uncertainty_samples = 0
+    yhat = model.predict(horizon)["yhat"].to_numpy()
+    if method == "bootstrap":
+        fitted = model.predict(model.history[["ds"]])["yhat"].to_numpy()
+        return yhat, residual_bootstrap(yhat, model.history["y"].to_numpy() - fitted, n_samples)
+
+    model.uncertainty_samples = n_samples
+    return yhat, np.asarray(model.predictive_samples(horizon)["yhat"], dtype=np.float64)
+
+###############################
+#  2) 分位數                  #
+###############################
+def quantile_bands(samples, quantiles=None, interval_width=None):
+    """
+    samples: (n_rows, n_samples) => (quantiles {key: (n_rows,)}, lower (n_rows,), upper (n_rows,))
+    一次 np.quantile 算完所有列與所有分位數
+    """
+    quantiles = QUANTILES if quantiles is None else quantiles
+    interval_width = INTERVAL_WIDTH if interval_width is None else interval_width
+    alpha = (1 - interval_width) / 2
+    qs = list(quantiles) + [alpha, 1 - alpha]
+    values = np.quantile(np.asarray(samples, dtype=np.float64), qs, axis=1)
+    bands = {quantile_key(q): values[i] for i, q in enumerate(quantiles)}
+    return bands, values[-2], values[-1]
+
+def attach_bands(records, quantiles=None, interval_width=None):
+    """records 每筆含 samples => 補上 yhat_lower / yhat_upper / quantiles (原地修改並回傳)"""
+    if not records:
+        return records
+    bands, lower, upper = quantile_bands([row["samples"] for row in records], quantiles, interval_width)
+    for i, row in enumerate(records):
+        row["yhat_lower"] = float(lower[i])
+        row["yhat_upper"] = float(upper[i])
+        row["quantiles"] = {key: float(v[i]) for key, v in bands.items()}
+    return records
+
+###############################
+#  3) 與 MongoDB 串接         #
+###############################
+def sample_docs(predictions):
+    """預測清單 (含 samples) => <coll>_samples 的 docs; 同時把 samples 從預測中移除"""
+    return [{
+        "productName": p["productName"],
+        "timestamp": p["timestamp"],
+        "samples": [float(v) for v in p.pop("samples")],
+    } for p in predictions if "samples" in p]
+
+def save_samples(db, coll_name, docs, productNames=None):
+    coll = db[samples_coll(coll_name)]
+    if productNames:
+        coll.delete_many({"productName": {"$in": list(productNames)}})
+    else:
+        coll.delete_many({})
+    if docs:
+        coll.insert_many(docs, ordered=False)
+
+def rebuild_bands(coll_name, quantiles=None, interval_width=None, db=None):
+    """讀已存的抽樣, 重算所有預測的分位數 / lower_bound / upper_bound, 一次 bulk_write 寫回"""
+    db = db if db is not None else get_db()
+    docs = list(db[samples_coll(coll_name)].find({}, {"_id": 0, "productName": 1, "timestamp": 1, "samples": 1}))
+    if not docs:
+        return 0
+    bands, lower, upper = quantile_bands([doc["samples"] for doc in docs], quantiles, interval_width)
+    operations = [
+        UpdateOne(
+            {"productName": doc["productName"], "timestamp": doc["timestamp"]},
+            {"$set": {
+                "lower_bound": float(lower[i]),
+                "upper_bound": float(upper[i]),
+                "quantiles": {key: float(v[i]) for key, v in bands.items()},
+            }}
+        )
+        for i, doc in enumerate(docs)
+    ]
+    return db[coll_name].bulk_write(operations, ordered=False).modified_count
+
+def main():
+    coll_name = sys.argv[1] if len(sys.argv) > 1 else "future_quantity_data"
+    interval_width = float(sys.argv[2]) if len(sys.argv) > 2 else INTERVAL_WIDTH
+    print("=== [prediction_intervals.py] START ===")
+    modified = rebuild_bands(coll_name, interval_width=interval_width)
+    print(f"{coll_name}: {modified} forecasts updated (interval_width={interval_width})")
+    print("=== [prediction_intervals.py] END ===")
+
+if __name__ == "__main__":
+    main()
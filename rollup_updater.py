@@ -0,0 +1,194 @@
+import os
+from collections import defaultdict
+from datetime import datetime
+from pymongo import UpdateOne, ASCENDING
+
+from mongo_io import get_db
+from luboil_schema import DimensionDictionary, DIMENSION_FIELDS, DIMENSIONS_COLL, expand_doc
+
+# 彙總表設定: collection 名稱 => (時間粒度, 分組維度)
+# dashboard 只需要 productName (+ custPlace) x 日/月 的加總, 不需要逐筆交易
+ROLLUP_SPECS = {
+    "luboil_daily_rollup":          ("day",   ["productName"]),
+    "luboil_daily_region_rollup":   ("day",   ["productName", "custPlace"]),
+    "luboil_monthly_rollup":        ("month", ["productName"]),
+    "luboil_monthly_region_rollup": ("month", ["productName", "custPlace"]),
+}
+
+def rollups_via_change_stream():
+    """
+    彙總表 / 線上特徵的唯一寫入者 (csv_data_updater 與 change_stream_watcher 共用這個設定):
+      ROLLUPS_VIA_CHANGE_STREAM=1 => change_stream_watcher 負責, 匯入流程不累加
+      其他 (預設)                 => 匯入流程負責, watcher 拒絕啟動
+    兩邊都累加會把每筆交易算兩次
+    """
+    return os.getenv("ROLLUPS_VIA_CHANGE_STREAM", "0") == "1"
+
+def bucket_timestamp(timestamp, grain):
+    """
+    將交易 timestamp (BSON date 或 ISO 字串, ex: "2024-11-30T00:00:00Z") 轉成彙總用的時間桶,
+    格式維持與 luboil_data 相同的 ISO 字串, 前端可直接 new Date() / 比對
+      day   -> "2024-11-30T00:00:00Z"
+      month -> "2024-11-01T00:00:00Z"
+    """
+    date_str = timestamp.strftime("%Y-%m-%d") if isinstance(timestamp, datetime) else str(timestamp)[:10]
+    if grain == "month":
+        date_str = date_str[:8] + "01"
+    return date_str + "T00:00:00Z"
+
+###############################
+#  1) 增量更新                #
+###############################
+def build_rollup_operations(docs):
+    """
+    先在記憶體內把這批交易依 (collection, key) 加總, 再轉成 $inc upsert,
+    同一天同商品的多筆交易只會變成一個 UpdateOne
+    回傳 { collection名稱: [UpdateOne, ...] }
+    """
+    totals = {coll_name: defaultdict(lambda: [0.0, 0.0, 0]) for coll_name in ROLLUP_SPECS}
+
+    for doc in docs:
+        if not doc.get("productName") or not doc.get("timestamp"):
+            continue
+        quantity = float(doc.get("quantity") or 0.0)
+        sales_amount = float(doc.get("salesAmount") or 0.0)
+
+        for coll_name, (grain, dims) in ROLLUP_SPECS.items():
+            key = (bucket_timestamp(doc["timestamp"], grain),) + tuple(doc.get(d) for d in dims)
+            acc = totals[coll_name][key]
+            acc[0] += quantity
+            acc[1] += sales_amount
+            acc[2] += 1
+
+    operations = {}
+    for coll_name, (grain, dims) in ROLLUP_SPECS.items():
+        ops = []
+        for key, (quantity, sales_amount, count) in totals[coll_name].items():
+            query = {"timestamp": key[0]}
+            query.update(dict(zip(dims, key[1:])))
+            ops.append(UpdateOne(
+                query,
+                {"$inc": {"quantity": quantity, "salesAmount": sales_amount, "count": count}},
+                upsert=True
+            ))
+        if ops:
+            operations[coll_name] = ops
+    return operations
+
+def apply_docs_to_rollups(db, docs, dims=None):
+    """
+    將新插入 luboil_data 的交易 docs 累加到各彙總表 (csv_data_updater 插入後呼叫)
+    精簡格式的 doc 會先以維度字典還原 custPlace 名稱
+    回傳各 collection 受影響的 key 數
+    """
+    dims = dims or DimensionDictionary(db)
+    docs = [expand_doc(doc, dims) for doc in docs]
+    affected = {}
+    for coll_name, ops in build_rollup_operations(docs).items():
+        db[coll_name].bulk_write(ops, ordered=False)
+        affected[coll_name] = len(ops)
+    return affected
+
+###############################
+#  2) 全量重建                #
+###############################
+def ensure_rollup_indexes(db):
+    """每個彙總表以 (維度..., timestamp) 建唯一索引, upsert 與 API 查詢都走索引"""
+    for coll_name, (_, dims) in ROLLUP_SPECS.items():
+        keys = [(d, ASCENDING) for d in dims] + [("timestamp", ASCENDING)]
+        db[coll_name].create_index(keys, unique=True)
+
+def rollup_pipeline(coll_name, grain, dims):
+    """
+    rebuild_rollups 用的 aggregation pipeline:
+      1) 依 (時間桶, 維度) 加總; 維度舊格式為字串, 精簡格式為代碼, 兩者先分開分組
+      2) 以 luboil_dimensions 把代碼還原成字串
+      3) 再依還原後的名稱分組一次, backfill 進行中新舊格式並存時,
+         同一個地區 / 業務的兩組才會合併成一筆 (否則建唯一索引會失敗)
+    """
+    # timestamp 可能是 BSON date (精簡格式) 或 ISO 字串 (舊格式)
+    day_str = {"$cond": [
+        {"$eq": [{"$type": "$timestamp"}, "date"]},
+        {"$dateToString": {"date": "$timestamp", "format": "%Y-%m-%d"}},
+        {"$substrBytes": ["$timestamp", 0, 10]}
+    ]}
+    if grain == "month":
+        bucket = {"$concat": [{"$substrBytes": [day_str, 0, 8]}, "01T00:00:00Z"]}
+    else:
+        bucket = {"$concat": [day_str, "T00:00:00Z"]}
+
+    group_id = {"timestamp": bucket}
+    group_id.update({d: {"$ifNull": [f"${d}", f"${d}Id"]} if d in DIMENSION_FIELDS else f"${d}" for d in dims})
+
+    decode_stages = []
+    for d in dims:
+        if d not in DIMENSION_FIELDS:
+            continue
+        decode_stages += [
+            {"$lookup": {
+                "from": DIMENSIONS_COLL,
+                "let": {"code": f"${d}"},
+                "pipeline": [{"$match": {"$expr": {"$and": [
+                    {"$eq": ["$dim", d]}, {"$eq": ["$code", "$$code"]}
+                ]}}}],
+                "as": f"_{d}_dim"
+            }},
+            {"$set": {d: {"$ifNull": [{"$first": f"$_{d}_dim.value"}, f"${d}"]}}},
+            {"$unset": f"_{d}_dim"}
+        ]
+
+    project = {"_id": 0, "timestamp": "$_id.timestamp", "quantity": 1, "salesAmount": 1, "count": 1}
+    project.update({d: f"$_id.{d}" for d in dims})
+
+    regroup = []
+    if decode_stages:
+        regroup_id = {"timestamp": "$timestamp"}
+        regroup_id.update({d: f"${d}" for d in dims})
+        regroup = [
+            {"$group": {
+                "_id": regroup_id,
+                "quantity": {"$sum": "$quantity"},
+                "salesAmount": {"$sum": "$salesAmount"},
+                "count": {"$sum": "$count"}
+            }},
+            {"$project": project}
+        ]
+
+    return [
+        {"$match": {"productName": {"$nin": [None, ""]}, "timestamp": {"$type": ["string", "date"]}}},
+        {"$group": {
+            "_id": group_id,
+            "quantity": {"$sum": {"$toDouble": {"$ifNull": ["$quantity", 0]}}},
+            "salesAmount": {"$sum": {"$toDouble": {"$ifNull": ["$salesAmount", 0]}}},
+            "count": {"$sum": 1}
+        }},
+        {"$project": project},
+        *decode_stages,
+        *regroup,
+        {"$out": coll_name}
+    ]
+
+def rebuild_rollups(db, source_coll="luboil_data"):
+    """
+    從 luboil_data 全量重算彙總表 (第一次建立或資料被大量修改時使用),
+    計算在 MongoDB 端以 aggregation 完成, 結果 $out 覆蓋舊表;
+    migrate_luboil_schema 的 backfill 尚未完成 (新舊格式並存) 時也可以執行
+    """
+    for coll_name, (grain, dims) in ROLLUP_SPECS.items():
+        db[source_coll].aggregate(rollup_pipeline(coll_name, grain, dims), allowDiskUse=True)
+        print(f"[INFO] Rebuilt {coll_name} => {db[coll_name].estimated_document_count()} docs")
+
+    ensure_rollup_indexes(db)
+
+def main():
+    MONGODB_URI = os.getenv("MONGODB_URI")
+    if not MONGODB_URI:
+        raise ValueError("No MONGODB_URI in environment variables")
+
+    db = get_db(MONGODB_URI)
+    print("=== [rollup_updater.py] START ===")
+    rebuild_rollups(db)
+    print("=== [rollup_updater.py] END ===")
+
+if __name__ == "__main__":
+    main()
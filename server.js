@@ -43,6 +43,40 @@ app.get('/api/luboil_data', async (req, res) => {
   }
 });
 
+// 預先彙總的日 / 月資料 (由 rollup_updater.py 維護), 取代整個 luboil_data
+// ex: /api/luboil_rollup/daily?productName=R32&by=custPlace
+const ROLLUP_COLLECTIONS = {
+  daily: { product: 'luboil_daily_rollup', custPlace: 'luboil_daily_region_rollup' },
+  monthly: { product: 'luboil_monthly_rollup', custPlace: 'luboil_monthly_region_rollup' },
+};
+
+app.get('/api/luboil_rollup/:grain', async (req, res) => {
+  console.log(`Received request for /api/luboil_rollup/${req.params.grain}`);
+
+  const collections = ROLLUP_COLLECTIONS[req.params.grain];
+  const collName = collections && collections[req.query.by || 'product'];
+  if (!collName) {
+    return res.status(400).json({ error: "Unknown rollup grain or dimension" });
+  }
+
+  try {
+    const query = {};
+    for (const key of ['productName', 'custPlace']) {
+      if (req.query[key]) {
+        query[key] = req.query[key];
+      }
+    }
+    const rollupData = await db.collection(collName)
+      .find(query, { projection: { _id: 0 } })
+      .sort({ timestamp: 1 })
+      .toArray();
+    res.json(rollupData);
+  } catch (error) {
+    console.error(`Error fetching data from '${collName}':`, error);
+    res.status(500).json({ error: `Failed to fetch data from '${collName}'` });
+  }
+});
+
 // 新增的 /api/future_luboil_data 路由
 app.get('/api/future_luboil_data', async (req, res) => {
   console.log("Received request for /api/future_luboil_data");
@@ -71,6 +105,29 @@ app.get('/api/future_luboil_monthly', async (req, res) => {
   }
 });
 
+// 階層預測 (product x custPlace / salesPerson), 可用 query 參數 drill down
+// ex: /api/future_luboil_hierarchy?productName=R32&hierarchy=custPlace&freq=D
+app.get('/api/future_luboil_hierarchy', async (req, res) => {
+  console.log("Received request for /api/future_luboil_hierarchy");
+
+  try {
+    const query = {};
+    for (const key of ['productName', 'freq', 'hierarchy', 'level', 'member']) {
+      if (req.query[key]) {
+        query[key] = req.query[key];
+      }
+    }
+    const hierarchyData = await db.collection('future_quantity_hierarchy')
+      .find(query)
+      .sort({ timestamp: 1 })
+      .toArray();
+    res.json(hierarchyData);
+  } catch (error) {
+    console.error("Error fetching data from 'future_quantity_hierarchy':", error);
+    res.status(500).json({ error: "Failed to fetch data from 'future_quantity_hierarchy'" });
+  }
+});
+
 // 獲取最新的日期
 app.get("/api/luboil_data_latest", async (req, res) => {
   console.log("Received request for /api/luboil_data_latest");
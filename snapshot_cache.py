@@ -0,0 +1,181 @@
+import os
+import json
+import shutil
+from datetime import datetime
+
+import pandas as pd
+
+from mongo_io import fetch_frame, get_db, LUBOIL_SCHEMA
+from luboil_schema import SCHEMA_VERSION, load_data_meta
+
+# luboil_data 的本機欄位式快照:
+#   snapshot/productName=R32/month=2024-01.parquet   (已封存的月份, 之後不會再變)
+#   snapshot/manifest.json                            ({ watermark, partitions, rows, source, compactOnly })
+# 上個月以前的歷史不會再變動 (csv_data_updater 只插入比 DB 最大 timestamp 更新的資料),
+# 所以只需從 MongoDB 讀 watermark 之後的資料, 其餘以 memory-map 讀本機 Parquet
+# source = luboil_meta 的 { 世代, watermark 以前各月份筆數合計 } (由各匯入流程累加, 見 luboil_schema.record_inserts);
+# 之後不一致 (delete_all_data 後重新匯入、當時資料只匯入一半...) 就整個快照重建.
+# 啟動時只讀 manifest 與 luboil_meta 一筆 doc, 不掃描歷史資料
+# 需要 pyarrow, 且資料已全部轉為精簡格式 (migrate_luboil_schema.py): 第一次建立快照時檢查一次
+# (有舊格式 doc 就報錯), 通過後記在 manifest 的 compactOnly, 之後不再檢查
+
+SNAPSHOT_DIR = os.getenv("LUBOIL_SNAPSHOT_DIR", "snapshot")
+MANIFEST_FILE = "manifest.json"
+DIMENSION_COLUMNS = [name for name, kind in LUBOIL_SCHEMA.items() if kind == "category"]
+
+def _manifest_path(snapshot_dir):
+    return os.path.join(snapshot_dir, MANIFEST_FILE)
+
+def load_manifest(snapshot_dir=SNAPSHOT_DIR):
+    path = _manifest_path(snapshot_dir)
+    if not os.path.exists(path):
+        return {"watermark": None, "partitions": [], "rows": 0, "source": None, "compactOnly": False}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, snapshot_dir=SNAPSHOT_DIR):
+    # 先寫暫存檔再 rename, 中途失敗不會留下半個 manifest
+    tmp_path = _manifest_path(snapshot_dir) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, _manifest_path(snapshot_dir))
+
+def frozen_watermark(today=None):
+    """封存邊界 = 上個月 1 號 (此日期之前的月份視為不再變動)"""
+    today = today or datetime.utcnow()
+    year, month = today.year, today.month - 1
+    if month == 0:
+        year, month = year - 1, 12
+    return datetime(year, month, 1)
+
+def require_compact_schema(db, manifest):
+    """
+    timestamp 為字串的舊格式 doc 不會被 watermark 的日期查詢選到, 有的話直接報錯.
+    schemaVersion 沒有索引 (整個 collection 掃描), 所以 manifest 記錄通過後就不再檢查
+    (之後的匯入流程都只寫精簡格式)
+    """
+    if manifest.get("compactOnly"):
+        return
+    if db["luboil_data"].find_one({"schemaVersion": {"$ne": SCHEMA_VERSION}}, {"_id": 1}) is not None:
+        raise RuntimeError("luboil_data has documents with schemaVersion != 2, run migrate_luboil_schema.py first.")
+
+def source_fingerprint(db, watermark):
+    """
+    { generation, rows }: luboil_meta 的世代與 watermark 以前各月份筆數合計 (只讀一筆 doc);
+    與 manifest 記錄的不同代表封存區間的資料被換過
+    """
+    generation, months = load_data_meta(db)
+    frozen_month = f"{watermark:%Y-%m}"
+    return {"generation": generation, "rows": sum(n for month, n in months.items() if month < frozen_month)}
+
+def clear_snapshot(manifest, snapshot_dir=SNAPSHOT_DIR):
+    for productName in {part["productName"] for part in manifest["partitions"]}:
+        shutil.rmtree(os.path.join(snapshot_dir, f"productName={productName}"), ignore_errors=True)
+    return {"watermark": None, "partitions": [], "rows": 0, "source": None, "compactOnly": False}
+
+###############################
+#  1) 更新快照                #
+###############################
+def refresh_snapshot(snapshot_dir=SNAPSHOT_DIR, mongo_uri=None, today=None):
+    """
+    把 舊 watermark ~ 新 watermark 之間的資料寫成 Parquet 分區並推進 watermark;
+    watermark 沒變時不做任何事. 封存區間的來源資料變了 (source 不符) 就清掉快照從頭建立;
+    區間內完全沒有資料時不推進 watermark (資料可能尚未匯入)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    db = get_db(mongo_uri)
+    manifest = load_manifest(snapshot_dir)
+    new_watermark = frozen_watermark(today)
+    old_watermark = datetime.fromisoformat(manifest["watermark"]) if manifest["watermark"] else None
+    if old_watermark is not None and source_fingerprint(db, old_watermark) != manifest.get("source"):
+        print("[WARN] luboil_data changed before the snapshot watermark, rebuilding snapshot.")
+        manifest = clear_snapshot(manifest, snapshot_dir)
+        old_watermark = None
+    require_compact_schema(db, manifest)
+    if old_watermark is not None and old_watermark >= new_watermark:
+        return manifest
+
+    query = {"timestamp": {"$lt": new_watermark}}
+    if old_watermark is not None:
+        query["timestamp"]["$gte"] = old_watermark
+    df = fetch_frame("luboil_data", query=query, mongo_uri=mongo_uri)
+
+    partitions = list(manifest["partitions"])
+    rows = manifest["rows"]
+    if not df.empty:
+        df = df.dropna(subset=["productName", "timestamp"])
+        df["month"] = df["timestamp"].dt.strftime("%Y-%m")
+        for (productName, month), part in df.groupby(["productName", "month"], observed=True):
+            part_dir = os.path.join(snapshot_dir, f"productName={productName}")
+            os.makedirs(part_dir, exist_ok=True)
+            rel_path = os.path.join(f"productName={productName}", f"month={month}.parquet")
+            table = pa.Table.from_pandas(part.drop(columns=["month"]), preserve_index=False)
+            pq.write_table(table, os.path.join(snapshot_dir, rel_path))
+            partitions.append({"productName": str(productName), "month": month, "path": rel_path, "rows": len(part)})
+            rows += len(part)
+    if rows == 0:
+        print("[WARN] No history before the watermark yet, snapshot not advanced.")
+        return manifest
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    manifest = {
+        "watermark": new_watermark.isoformat(), "partitions": partitions, "rows": rows,
+        "source": source_fingerprint(db, new_watermark), "compactOnly": True,
+    }
+    save_manifest(manifest, snapshot_dir)
+    print(f"[INFO] Snapshot refreshed => watermark {manifest['watermark']}, {rows} rows")
+    return manifest
+
+###############################
+#  2) 讀取 (快照 + 增量)      #
+###############################
+def load_history(productNames=None, snapshot_dir=SNAPSHOT_DIR, mongo_uri=None, refresh=True):
+    """
+    回傳完整交易歷史 DataFrame (欄位同 fetch_frame):
+      watermark 以前 -> memory-map 讀本機 Parquet
+      watermark 以後 -> 從 MongoDB 讀
+    productNames: 只讀指定商品 (None = 全部)
+    """
+    import pyarrow.parquet as pq
+
+    if refresh:
+        manifest = refresh_snapshot(snapshot_dir, mongo_uri)
+    else:
+        manifest = load_manifest(snapshot_dir)
+        require_compact_schema(get_db(mongo_uri), manifest)
+
+    frames = []
+    for part in manifest["partitions"]:
+        if productNames and part["productName"] not in productNames:
+            continue
+        table = pq.read_table(os.path.join(snapshot_dir, part["path"]), memory_map=True)
+        frames.append(table.to_pandas())
+
+    query = {}
+    if manifest["watermark"]:
+        query["timestamp"] = {"$gte": datetime.fromisoformat(manifest["watermark"])}
+    if productNames:
+        query["productName"] = {"$in": list(productNames)}
+    frames.append(fetch_frame("luboil_data", query=query, mongo_uri=mongo_uri))
+
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    # 各分區的類別表不同, 合併後重新編成 category
+    for col in DIMENSION_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+def snapshot_enabled():
+    """設定 LUBOIL_SNAPSHOT=1 時, 各 job 改用快照讀取歷史"""
+    return os.getenv("LUBOIL_SNAPSHOT", "0") == "1"
+
+def main():
+    print("=== [snapshot_cache.py] START ===")
+    manifest = refresh_snapshot()
+    print(f"Partitions: {len(manifest['partitions'])}, rows: {manifest['rows']}, watermark: {manifest['watermark']}")
+    print("=== [snapshot_cache.py] END ===")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 各模組都是放在專案根目錄的腳本, 測試直接 import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from chunked_features import check_parity, build_features_chunked, iter_frame_chunks
+from update_and_retrain_all import FEATURE_COLS, feature_engineering_for_product
+
+START_DATE, END_DATE = "2023-01-01", "2024-11-30"
+
+def make_history(n_rows=2000, seed=0):
+    """同一天內有多筆、時間不同的交易 (rolling_avg_quantity_7 對同日順序敏感)"""
+    rng = np.random.default_rng(seed)
+    timestamps = (
+        pd.Timestamp("2022-12-01")
+        + pd.to_timedelta(rng.integers(0, 760, n_rows), unit="D")
+        + pd.to_timedelta(rng.integers(0, 24 * 60, n_rows), unit="min")
+    )
+    return pd.DataFrame({
+        "productName": "R32",
+        "timestamp": timestamps,
+        "quantity": rng.integers(1, 400, n_rows).astype(float),
+        "salesAmount": rng.uniform(100, 5000, n_rows),
+        "custPlace": pd.Categorical(rng.choice(["北區", "中區", "南區"], n_rows)),
+        "salesPerson": pd.Categorical(rng.choice([f"業務員{i:02d}" for i in range(12)], n_rows)),
+    })
+
+@pytest.mark.parametrize("chunk_size", [7, 333, 5000])
+def test_chunked_matches_in_memory(chunk_size):
+    df = make_history()
+    assert check_parity(df, feature_engineering_for_product, FEATURE_COLS, START_DATE, END_DATE, chunk_size)
+
+def test_iso_string_timestamps():
+    df = make_history(500, seed=1)
+    df["timestamp"] = df["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    assert check_parity(df, feature_engineering_for_product, FEATURE_COLS, START_DATE, END_DATE, 64)
+
+def test_unsorted_chunks_rejected():
+    df = make_history(200, seed=2)
+    chunks = list(iter_frame_chunks(df, 50))[::-1]
+    with pytest.raises(ValueError):
+        build_features_chunked(lambda: iter(chunks), FEATURE_COLS, START_DATE, END_DATE)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from compact_forest import THRESHOLD_MODES, export_forest, load_forest, check_parity
+
+@pytest.fixture(scope="module")
+def tiny_forest():
+    rng = np.random.default_rng(0)
+    # 整數欄位 (類似 one-hot / 促銷期) + 連續欄位, 讓切點落在各種位置
+    X = np.column_stack([
+        rng.integers(0, 2, 400),
+        rng.normal(100, 30, 400),
+        rng.uniform(0, 1, 400),
+    ])
+    y = X[:, 0] * 50 + X[:, 1] * 0.3 + rng.normal(0, 5, 400)
+    model = RandomForestRegressor(n_estimators=8, random_state=42).fit(X, y)
+    X_test = np.vstack([X, rng.normal(100, 60, (200, 3))])
+    return model, X_test
+
+@pytest.mark.parametrize("threshold_mode", THRESHOLD_MODES)
+def test_predict_matches_sklearn(tiny_forest, tmp_path, threshold_mode):
+    model, X = tiny_forest
+    forest = load_forest(export_forest(model, str(tmp_path / "model.forest"), threshold_mode))
+    assert np.array_equal(model.predict(X), forest.predict(X))
+    assert check_parity(model, forest, X) == (True, 0.0)
+
+def test_unknown_threshold_mode(tiny_forest, tmp_path):
+    model, _ = tiny_forest
+    with pytest.raises(ValueError):
+        export_forest(model, str(tmp_path / "model.forest"), "float16")
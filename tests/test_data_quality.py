@@ -0,0 +1,41 @@
+import csv
+import io
+
+import bson
+
+from data_quality import EXTRA_COL, check_frame, frame_from_records, quarantine_docs, reasons_for
+
+HEADER = "productName,timestamp,quantity,salesAmount,processYm,cardCode,productNumber,salesPerson,custName,custPlace\n"
+GOOD = "R32,2024-01-05T00:00:00Z,10,1000,202401,C001,P001,業務員01,客戶A,北區\n"
+
+def read_csv_rows(text):
+    return list(csv.DictReader(io.StringIO(text)))
+
+def test_extra_fields_are_flagged_and_quarantine_docs_encode():
+    rows = read_csv_rows(
+        HEADER
+        + GOOD
+        + "R32,2024-01-06T00:00:00Z,10,1000,202401,C001,P001,業務員01,客戶A,北區,oops,more\n"
+        + "R32,not-a-date,10,1000,202401,C001,P001,業務員01,客戶A,北區\n"
+    )
+    raw = frame_from_records(rows)
+    assert all(isinstance(col, str) for col in raw.columns)
+
+    _, flags = check_frame(raw)
+    assert reasons_for(int(flags[0])) == []
+    assert reasons_for(int(flags[1])) == ["EXTRA_FIELDS"]
+    assert "BAD_TIMESTAMP" in reasons_for(int(flags[2]))
+
+    docs = quarantine_docs(raw, flags, source="test.csv")
+    assert [doc["record"].get(EXTRA_COL) for doc in docs] == ["oops,more", None]
+    for doc in docs:
+        bson.encode(doc)  # 不可有非字串 key
+
+def test_identical_rows_are_kept_by_default(monkeypatch):
+    raw = frame_from_records(read_csv_rows(HEADER + GOOD + GOOD))
+    _, flags = check_frame(raw)
+    assert list(flags) == [0, 0]
+
+    monkeypatch.setattr("data_quality.QUARANTINE_DUPLICATES", True)
+    _, flags = check_frame(raw)
+    assert reasons_for(int(flags[1])) == ["DUPLICATE"]
@@ -0,0 +1,28 @@
+import random
+import threading
+
+from forecast_cache import DiskStore
+
+def test_disk_store_concurrent_get_put_evict(tmp_path):
+    # ASYNC_IO: 多個 thread 同時讀寫 / 淘汰, 不可因檔案剛被刪除而丟出 FileNotFoundError
+    store = DiskStore(str(tmp_path))
+    errors = []
+
+    def work(seed):
+        rng = random.Random(seed)
+        try:
+            for _ in range(300):
+                key = str(rng.randint(0, 30))
+                store.put(key, [{"ds": "2024-01-01T00:00:00", "yhat": 1.0}])
+                store.get(key)
+                store.evict(5)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert len(list(tmp_path.glob("*.json"))) <= 5 + len(threads)
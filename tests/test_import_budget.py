@@ -0,0 +1,45 @@
+import pytest
+
+import luboil_cli
+from luboil_cli import COMMANDS, HEAVY_MODULES, check_import_budget
+
+def test_all_commands_within_budget():
+    # 只檢查 import 時載入了哪些重型套件, 與 CI 機器快慢無關
+    assert check_import_budget(list(COMMANDS)) == 0
+
+@pytest.mark.parametrize("name", ["retrain", "forecast", "forecast-monthly", "hierarchy"])
+def test_training_commands_defer_sklearn_and_prophet(name):
+    _, packages = luboil_cli.measure_import(COMMANDS[name][0])
+    assert not packages & {"sklearn", "scipy", "joblib", "prophet"}
+
+def fake_measure(module_name, packages=(), error=False):
+    def measure(module=None):
+        if module == module_name:
+            if error:
+                raise RuntimeError(f"import {module} failed")
+            return 10.0, {"os", "sys", *packages}
+        return 1.0, {"os", "sys"}
+    return measure
+
+@pytest.mark.parametrize("failure", ["error", "heavy"])
+def test_budget_failure_fails(monkeypatch, failure):
+    name = "ingest"
+    module_name = COMMANDS[name][0]
+    measure = fake_measure(module_name, packages=HEAVY_MODULES, error=failure == "error")
+    monkeypatch.setattr(luboil_cli, "measure_import", measure)
+    assert check_import_budget([name]) == 1
+
+def test_allowed_heavy_modules_pass(monkeypatch):
+    name = "retrain"
+    module_name, _, _, allowed = COMMANDS[name]
+    monkeypatch.setattr(luboil_cli, "measure_import", fake_measure(module_name, packages=allowed))
+    assert check_import_budget([name]) == 0
+
+def test_ratio_budget_is_opt_in(monkeypatch):
+    name = "ingest"
+    monkeypatch.setattr(luboil_cli, "measure_import", fake_measure(COMMANDS[name][0]))
+    monkeypatch.delenv("IMPORT_BUDGET_X", raising=False)
+    assert check_import_budget([name]) == 0
+    # (10 - 1) ms / 1 ms = 9x
+    assert check_import_budget(["--budget-x", "5", name]) == 1
+    assert check_import_budget(["--budget-x", "20", name]) == 0
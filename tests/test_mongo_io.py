@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from luboil_schema import parse_timestamp
+from mongo_io import _ColumnBuilder
+
+def test_datetime_column_converts_offsets_to_utc():
+    # 舊格式 ISO 字串帶 +08:00 時, 結果必須與 parse_timestamp 相同 (UTC), 不可直接截掉時區
+    values = [
+        "2024-01-01T08:00:00+08:00",
+        "2024-01-01T00:00:00Z",
+        "2024-01-01T00:00:00",
+        "2023-12-31T19:00:00.500-05:00",
+        datetime(2024, 1, 1, 8, tzinfo=timezone(timedelta(hours=8))),
+        datetime(2024, 1, 1),
+        "not a date",
+        None,
+    ]
+    builder = _ColumnBuilder("datetime")
+    builder.append(values)
+    data, _ = builder.finish()
+
+    expected = np.datetime64(parse_timestamp(values[0]).astimezone(timezone.utc).replace(tzinfo=None), "ns")
+    assert expected == np.datetime64("2024-01-01T00:00:00", "ns")
+    assert (data[:3] == expected).all()
+    assert data[3] == np.datetime64("2024-01-01T00:00:00.500", "ns")
+    assert (data[4:6] == expected).all()
+    assert np.isnat(data[6:]).all()
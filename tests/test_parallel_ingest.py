@@ -0,0 +1,53 @@
+import csv
+
+import numpy as np
+import pandas as pd
+
+from data_quality import check_frame, check_rows, check_batch, frame_from_records, reasons_for
+from luboil_schema import to_compact_doc
+from parallel_ingest import frame_to_docs, plan_tasks, read_chunk
+
+CSV_TEXT = (
+    '"productName","timestamp","quantity","salesAmount","processYm","cardCode","productNumber","salesPerson","custName","custPlace"\n'
+    'R32,2024-01-05T00:00:00Z,10,1000,202401,,P001,業務員01,"客戶A, 台中",北區\n'
+    "R32,2024-01-06T00:00:00Z,12,1200,202401,C001,P001,業務員01,客戶A,北區,oops\n"
+    "R32,2024-01-07T00:00:00Z,8,800,202401,C002,P001,業務員02,客戶B\n"
+    "R46,2024-01-07T00:00:00Z,5,500,202401,C003,P002,業務員02,客戶B,南區\n"
+)
+
+class FakeDims:
+    def encode(self, dim, value):
+        return None if value is None or value == "" else len(value)
+
+def parse_parallel(path, chunk_bytes):
+    parts = [read_chunk(*task[:3]) for task in plan_tasks([path], chunk_bytes)]
+    results = [check_rows(raw) for raw in parts]
+    raw = pd.concat(parts, ignore_index=True)
+    typed = pd.concat([r[0] for r in results], ignore_index=True)
+    flags = np.concatenate([r[1] for r in results]) | check_batch(raw, typed)
+    return raw, typed, flags
+
+def test_parallel_parse_matches_sequential(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text(CSV_TEXT, encoding="utf-8-sig")
+
+    with open(path, "r", encoding="utf-8-sig") as f:
+        seq_raw = frame_from_records(list(csv.DictReader(f)))
+    _, seq_flags = check_frame(seq_raw)
+
+    for chunk_bytes in (40, 1 << 20):
+        raw, typed, flags = parse_parallel(str(path), chunk_bytes)
+        assert list(flags) == list(seq_flags)
+        assert [reasons_for(int(f)) for f in flags] == [[], ["EXTRA_FIELDS"], ["UNKNOWN_CUST_PLACE"], []]
+
+        good = typed[flags == 0].reset_index(drop=True)
+        parallel_docs = frame_to_docs(good, FakeDims())
+        seq_docs = [
+            to_compact_doc(dict(record, timestamp=ts.to_pydatetime()), FakeDims())
+            for record, ts, ok in zip(seq_raw.to_dict(orient="records"), check_frame(seq_raw)[0]["timestamp"], seq_flags == 0)
+            if ok
+        ]
+        for doc in seq_docs:
+            doc["processYm"] = int(doc["processYm"])
+        assert parallel_docs == seq_docs
+        assert parallel_docs[0]["cardCode"] is None
@@ -0,0 +1,39 @@
+import pytest
+
+import change_stream_watcher
+import csv_data_updater
+
+DOCS = [{"productName": "R32", "timestamp": "2024-01-05T00:00:00Z", "quantity": 10.0}]
+
+@pytest.fixture
+def applied(monkeypatch):
+    """記錄彙總表 / 線上特徵被累加的次數 (不連 DB)"""
+    calls = []
+    for module in (csv_data_updater, change_stream_watcher):
+        monkeypatch.setattr(module, "apply_docs_to_rollups", lambda db, docs, dims=None: calls.append("rollups") or {})
+        monkeypatch.setattr(module, "update_features_from_docs", lambda db, docs, dims=None: calls.append("features") or {})
+    monkeypatch.setattr(change_stream_watcher, "mark_products_dirty", lambda db, names: None)
+    monkeypatch.setenv("MONGODB_URI", "mongodb://localhost:1/unused")
+    return calls
+
+def test_default_settings_ingest_is_the_only_writer(monkeypatch, applied):
+    monkeypatch.delenv("ROLLUPS_VIA_CHANGE_STREAM", raising=False)
+    csv_data_updater.update_derived(None, DOCS, None)
+    with pytest.raises(SystemExit):
+        change_stream_watcher.main()
+    assert applied == ["rollups", "features"]
+
+def test_change_stream_mode_watcher_is_the_only_writer(monkeypatch, applied):
+    monkeypatch.setenv("ROLLUPS_VIA_CHANGE_STREAM", "1")
+    csv_data_updater.update_derived(None, DOCS, None)
+    change_stream_watcher.flush(None, DOCS, None)
+    assert applied == ["rollups", "features"]
+
+def test_rebuild_groups_by_decoded_names():
+    # backfill 進行中: 舊格式 "北區" 與精簡格式代碼要在還原名稱之後才決定分組, 唯一索引才建得起來
+    from rollup_updater import rollup_pipeline
+
+    stages = [next(iter(stage)) for stage in rollup_pipeline("out", "day", ["productName", "custPlace"])]
+    last_lookup = max(i for i, name in enumerate(stages) if name == "$lookup")
+    assert "$group" in stages[last_lookup:]
+    assert stages[-1] == "$out"
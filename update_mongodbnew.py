@@ -1,82 +1,82 @@
 import os
 import json
 import logging
-from pymongo import MongoClient, InsertOne
-from datetime import datetime
+from pymongo import InsertOne
+from mongo_io import get_db, close_clients
+from luboil_schema import DimensionDictionary, to_compact_doc, ensure_luboil_indexes, record_inserts
 
-# 設置日誌
-logging.basicConfig(
-    filename="data_insertion.log",
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s: %(message)s"
-)
+def main():
+    # 設置日誌
+    logging.basicConfig(
+        filename="data_insertion.log",
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s: %(message)s"
+    )
 
-# 讀取 MongoDB URI（若沒設定環境變數，採用預設）
-mongodb_uri = os.getenv("MONGODB_URI")
+    # data_quality 需要 pandas, 連線與 import 都在真正執行時才做 (import 本模組不會連 DB)
+    from data_quality import frame_from_records, check_frame, quarantine_docs, write_quarantine, reasons_for
 
-client = MongoClient(mongodb_uri)
+    # 讀取 MongoDB URI（若沒設定環境變數，採用預設）
+    mongodb_uri = os.getenv("MONGODB_URI")
 
-def is_valid_record(record):
-    """
-    檢查資料紀錄的基本有效性：
-    1) timestamp：可被解析為 ISO8601
-    2) productName：不為空
-    (若需要檢查其他欄位，例如 quantity >= 0、salesAmount >= 0... 可自行加入)
-    """
-    # 檢查 timestamp
     try:
-        datetime.fromisoformat(record["timestamp"].replace("Z", "+00:00"))
-    except (ValueError, KeyError):
-        logging.error("Invalid or missing timestamp: %s", record.get("timestamp"))
-        return False
+        db = get_db(mongodb_uri)
+        collection = db["luboil_data"]  # 您若想換集合名，可自行改
+        logging.info("Connected to Database")
 
-    # 檢查 productName
-    if not record.get("productName"):
-        logging.error("Missing or empty productName for record: %s", record)
-        return False
+        # 維度字典 (custName / custPlace / salesPerson -> int 代碼)
+        dims = DimensionDictionary(db)
+        dims.ensure_indexes()
 
-    return True
+        # 打開 JSON 文件並讀取數據（假設檔名為 output.json）
+        json_file_path = "sixoildata202301_202409.json"
+        with open(json_file_path, "r", encoding="utf-8") as file:
+            data = json.load(file)
 
-try:
-    db = client["luboil_data_db"]
-    collection = db["luboil_data"]  # 您若想換集合名，可自行改
-    logging.info("Connected to Database")
+        operations = []
+        docs = []
+        valid_count = 0
+        invalid_count = 0
 
-    # 打開 JSON 文件並讀取數據（假設檔名為 output.json）
-    json_file_path = "sixoildata202301_202409.json"
-    with open(json_file_path, "r", encoding="utf-8") as file:
-        data = json.load(file)
+        # 整批資料品質檢查 (見 data_quality.py), 不合格的寫入 luboil_quarantine
+        raw = frame_from_records(data)
+        _, flags = check_frame(raw)
+        quarantined = write_quarantine(db, quarantine_docs(raw, flags, source=json_file_path))
+        if quarantined:
+            logging.warning("Quarantined records by reason: %s", quarantined)
 
-    operations = []
-    valid_count = 0
-    invalid_count = 0
+        for record, flag in zip(data, flags):
+            if flag == 0:
+                # 精簡格式, 見 luboil_schema.py
+                doc = to_compact_doc(record, dims)
+                operations.append(InsertOne(doc))
+                docs.append(doc)
+                valid_count += 1
+                logging.info("Prepared InsertOne for record: %s", record)
+            else:
+                invalid_count += 1
+                logging.warning("Invalid record %s, quarantined: %s", reasons_for(int(flag)), record)
 
-    for record in data:
-        # 驗證每筆資料
-        if is_valid_record(record):
-            # 不檢查重複，直接插入
-            operations.append(InsertOne(record))
-            valid_count += 1
-            logging.info("Prepared InsertOne for record: %s", record)
+        # 如果有有效資料就做 bulk_write
+        if operations:
+            result = collection.bulk_write(operations)
+            record_inserts(db, docs)
+            ensure_luboil_indexes(db)
+            logging.info("Bulk write result: %s", result.bulk_api_result)
+            print(f"成功插入 {valid_count} 筆有效紀錄，已寫入資料庫。")
         else:
-            invalid_count += 1
-            logging.warning("Invalid record, skipping: %s", record)
+            logging.info("No valid records to insert.")
+            print("沒有有效紀錄可插入。")
 
-    # 如果有有效資料就做 bulk_write
-    if operations:
-        result = collection.bulk_write(operations)
-        logging.info("Bulk write result: %s", result.bulk_api_result)
-        print(f"成功插入 {valid_count} 筆有效紀錄（含重複），已寫入資料庫。")
-    else:
-        logging.info("No valid records to insert.")
-        print("沒有有效紀錄可插入。")
+        if invalid_count > 0:
+            print(f"共有 {invalid_count} 筆資料未通過檢查，已移至 luboil_quarantine。")
 
-    if invalid_count > 0:
-        print(f"共有 {invalid_count} 筆資料格式不符，被跳過。")
+    except Exception as e:
+        logging.critical("Database operation failed: %s", e)
+        print(f"資料庫操作失敗: {e}")
 
-except Exception as e:
-    logging.critical("Database operation failed: %s", e)
-    print(f"資料庫操作失敗: {e}")
+    finally:
+        close_clients()
 
-finally:
-    client.close()
+if __name__ == "__main__":
+    main()